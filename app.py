@@ -1,16 +1,50 @@
 import streamlit as st
 import pandas as pd
-import requests
 from datetime import date, timedelta, datetime
 import plotly.express as px
+import io
+import os
+import tempfile
+import time
 import pytz
 
+from omie import api, metrics
+from omie.export import iter_chunks, write_csv, write_parquet
+from omie.figures import daily_figure, daily_layout
+from omie.forecast import Forecaster, catch_up, forecast_points
+from omie.frames import add_hour_labels, daily_frame, downsample, native_minutes, series_points, slot_label, zone_frame
+from omie.prefetch import HISTORY_START, PUBLICATION_TIME, start_prefetcher
+from omie.scheduler import Load, schedule
+from omie.series import price_series
+from omie.simulator import read_profile, simulate, slot_prices
+from omie.snapshot import alias_snapshot, read_snapshot, render_page, snapshot_dir, snapshot_name, write_snapshot
+from omie.store import MARKET_TZ, MIBEL_ZONES, ZONE_TZ, PriceStore, day_bounds
+from omie.tariff import TariffConfig, average_final_prices, final_prices, period_index
+
 # --- Configuration ---
 st.set_page_config(page_title="Iberian Energy Prices", page_icon="⚡", layout="wide")
 
 # --- 🔗 URL PARAMETER HANDLING ---
 qp = st.query_params
 
+# --- ⏱️ INSTRUMENTATION ---
+@st.cache_resource
+def start_metrics_server():
+    # Prometheus /metrics on OMIE_METRICS_PORT (one port per replica)
+    if os.environ.get("OMIE_METRICS_LOG") == "1": metrics.log_to_stderr()
+    port = os.environ.get("OMIE_METRICS_PORT")
+    return metrics.serve(int(port)) if port else None
+
+start_metrics_server()
+metrics.start_trace()
+rerun_started = time.perf_counter()
+# ?profile=1 profiles this session's full reruns and prints the report at the bottom
+profiler = None
+if qp.get("profile") == "1":
+    import cProfile
+    profiler = cProfile.Profile()
+    profiler.enable()
+
 def get_param(key, default_val, type_func):
     try:
         if key in qp:
@@ -19,18 +53,51 @@ def get_param(key, default_val, type_func):
     except:
         return default_val
 
-# Defaults
-default_lang_idx = get_param("lang_idx", 2, int)
-default_vat = get_param("vat", 23.0, float)
-default_comm_fee = get_param("comm_fee", 0.025, float)
-default_losses = get_param("losses", 16.74, float)
-default_grid_type = get_param("grid_type", "Fixed", str)
-default_grid_fixed = get_param("grid_fixed", 0.060, float)
-default_grid_p1 = get_param("grid_p1", 0.100, float)
-default_grid_p2 = get_param("grid_p2", 0.040, float)
-default_grid_p3 = get_param("grid_p3", 0.010, float)
-default_show_fixed_comp = get_param("show_fixed_comp", False, lambda x: x.lower() == 'true')
-default_fixed_val = get_param("fixed_val", 0.120, float)
+def parse_bool(value):
+    return value.lower() == 'true'
+
+# Defaults (key -> default value, parser)
+URL_PARAMS = {
+    "lang_idx": (2, int),
+    "vat": (23.0, float),
+    "comm_fee": (0.025, float),
+    "losses": (16.74, float),
+    "grid_type": ("Fixed", str),
+    "grid_fixed": (0.060, float),
+    "grid_p1": (0.100, float),
+    "grid_p2": (0.040, float),
+    "grid_p3": (0.010, float),
+    "show_fixed_comp": (False, parse_bool),
+    "fixed_val": (0.120, float),
+    "quarter_hour": (False, parse_bool),
+    "forecast": (True, parse_bool),
+}
+
+def load_url_defaults():
+    # The URL only seeds the widgets, so it is parsed once per session
+    if "url_defaults" not in st.session_state:
+        st.session_state["url_defaults"] = {key: get_param(key, default, parser) for key, (default, parser) in URL_PARAMS.items()}
+    return st.session_state["url_defaults"]
+
+def sync_query_params(values):
+    # One batched URL update with only the values that differ from the current URL
+    changed = {key: str(val) for key, val in values.items() if qp.get(key) != str(val)}
+    if changed: qp.update(changed)
+
+url_defaults = load_url_defaults()
+default_lang_idx = url_defaults["lang_idx"]
+default_vat = url_defaults["vat"]
+default_comm_fee = url_defaults["comm_fee"]
+default_losses = url_defaults["losses"]
+default_grid_type = url_defaults["grid_type"]
+default_grid_fixed = url_defaults["grid_fixed"]
+default_grid_p1 = url_defaults["grid_p1"]
+default_grid_p2 = url_defaults["grid_p2"]
+default_grid_p3 = url_defaults["grid_p3"]
+default_show_fixed_comp = url_defaults["show_fixed_comp"]
+default_fixed_val = url_defaults["fixed_val"]
+default_quarter_hour = url_defaults["quarter_hour"]
+default_forecast = url_defaults["forecast"]
 
 # --- 🌍 TRANSLATION ENGINE ---
 LANGUAGES = {
@@ -38,11 +105,15 @@ LANGUAGES = {
         "title": "⚡ Iberian Electricity Prices",
         "config_title": "⚙️ **CONFIGURE TARIFF** (Click to Open)",
         "tab_daily": "📅 Daily View",
-        "tab_history": "📈 30-Day Trend",
+        "tab_history": "📈 Price Trend",
+        "tab_zones": "🌍 Zones",
+        "tab_sim": "🧮 Simulator",
         "select_date": "Select Date",
         "country": "Country",
         "settings": "Settings",
         "show_raw": "Show Raw Market Price (€/MWh)",
+        "quarter_hour": "15-Minute Prices",
+        "quarter_help": "Show the quarter-hour market prices instead of hourly averages.",
         "comp_toggle": "Compare with Fixed Rate",
         "fixed_input": "Your Fixed Energy Price (€/kWh)",
         "taxes": "Taxes & Fees",
@@ -67,6 +138,37 @@ LANGUAGES = {
         "calc_cost": "Estimated Cost",
         "calc_start": "Best Start:",
         "view_table": "View Detailed Data Table",
+        "export_title": "📦 Bulk Export",
+        "export_range": "Date Range",
+        "export_zones": "Zones",
+        "export_format": "Format",
+        "export_button": "Download",
+        "forecast_toggle": "Forecast Tomorrow",
+        "forecast_help": "Before the 13:30 CET publication, show estimated prices for tomorrow from a model of the stored history.",
+        "forecast_flag": "🔮 Estimated prices: tomorrow's market results are published after 13:30 CET.",
+        "forecast_short": "(estimate)",
+        "snap_live": "Customize tariff, date and zone →",
+        "zones_title": "Bidding Zone Comparison",
+        "zones_select": "Zones",
+        "zones_note": "Raw day-ahead prices in €/MWh, in market time (CET).",
+        "zones_pick": "Pick at least one zone.",
+        "zones_spread": "Average Spread",
+        "zones_coupled": "Coupled Slots",
+        "zones_decoupled": "Slots where the zones decouple",
+        "sim_title": "Yearly Cost Simulator",
+        "sim_help": "Upload a smart-meter CSV (one row per hour or quarter-hour, with a timestamp and a kWh column) to compare the dynamic tariff with fixed rates.",
+        "sim_upload": "Consumption Profile (CSV)",
+        "sim_rates": "Fixed Rates to Compare (€/kWh)",
+        "sim_rates_help": "One or more rates before VAT, separated by spaces or ';'.",
+        "sim_bad_file": "⚠️ Could not read one kWh reading per timestamp from this file (date and time columns, no repeated slots).",
+        "sim_bad_rates": "⚠️ Could not read the fixed rates.",
+        "sim_raw_info": "The simulator needs a tariff: turn off the raw market price view.",
+        "sim_month": "Month",
+        "sim_dynamic": "Dynamic",
+        "sim_fixed": "Fixed",
+        "sim_coverage": "Priced Consumption",
+        "sim_dynamic_win": "✅ The dynamic tariff is cheaper than every fixed rate.",
+        "sim_dynamic_loss": "❌ A fixed rate would have been cheaper.",
         "table_title": "📋 Hourly Data",
         "download_csv": "📥 Download Data as CSV",
         "daily_summary": "Daily Summary",
@@ -80,6 +182,7 @@ LANGUAGES = {
         "interval_col": "Time Interval",
         "price_col": "Price",
         "base_col": "Base Market Price",
+        "date_axis": "Date",
         "now_label": "NOW",
         "verdict_good": "✅ Great time to use energy!",
         "verdict_bad": "❌ Expensive! Wait if possible.",
@@ -91,8 +194,15 @@ LANGUAGES = {
         "zone_punta": "Peak",
         "data_unavailable": "⚠️ Data not available for",
         "raw_info": "Showing raw market data in €/MWh. Taxes and tariffs are hidden.",
-        "hist_title": "Price Evolution (Last 30 Days)",
+        "hist_title": "Price Evolution",
         "hist_avg_note": "Showing daily average prices.",
+        "hist_month_note": "Showing monthly average prices.",
+        "hist_range": "Period",
+        "hist_avg": "Average",
+        "range_30d": "30 days",
+        "range_90d": "90 days",
+        "range_1y": "1 year",
+        "range_all": "Since 2015",
         "explain_title": "📝 Price Breakdown",
         "step_market": "1. Market Price",
         "step_losses": "2. Add Losses",
@@ -104,11 +214,15 @@ LANGUAGES = {
         "title": "⚡ Precio de la Luz (OMIE)",
         "config_title": "⚙️ **CONFIGURAR TARIFA** (Clic para Abrir)",
         "tab_daily": "📅 Vista Diaria",
-        "tab_history": "📈 Tendencia 30 Días",
+        "tab_history": "📈 Tendencia de Precios",
+        "tab_zones": "🌍 Zonas",
+        "tab_sim": "🧮 Simulador",
         "select_date": "Seleccionar Fecha",
         "country": "País",
         "settings": "Configuración",
         "show_raw": "Ver Precio Mercado (€/MWh)",
+        "quarter_hour": "Precios cuartohorarios",
+        "quarter_help": "Muestra los precios del mercado cada 15 minutos en lugar de medias horarias.",
         "comp_toggle": "Comparar con Tarifa Fija",
         "fixed_input": "Precio Energía Fijo (€/kWh)",
         "taxes": "Impuestos y Peajes",
@@ -133,6 +247,37 @@ LANGUAGES = {
         "calc_cost": "Coste Estimado",
         "calc_start": "Mejor Hora:",
         "view_table": "Ver Tabla de Datos",
+        "export_title": "📦 Exportación Masiva",
+        "export_range": "Rango de Fechas",
+        "export_zones": "Zonas",
+        "export_format": "Formato",
+        "export_button": "Descargar",
+        "forecast_toggle": "Previsión de Mañana",
+        "forecast_help": "Antes de la publicación de las 13:30 CET, muestra precios estimados para mañana a partir de un modelo del histórico guardado.",
+        "forecast_flag": "🔮 Precios estimados: los resultados del mercado de mañana se publican después de las 13:30 CET.",
+        "forecast_short": "(estimación)",
+        "snap_live": "Personalizar tarifa, fecha y zona →",
+        "zones_title": "Comparación de Zonas de Oferta",
+        "zones_select": "Zonas",
+        "zones_note": "Precios diarios brutos en €/MWh, en hora de mercado (CET).",
+        "zones_pick": "Elige al menos una zona.",
+        "zones_spread": "Diferencial Medio",
+        "zones_coupled": "Tramos Acoplados",
+        "zones_decoupled": "Tramos en los que las zonas se desacoplan",
+        "sim_title": "Simulador de Coste Anual",
+        "sim_help": "Sube un CSV del contador (una fila por hora o cuarto de hora, con fecha y kWh) para comparar la tarifa dinámica con precios fijos.",
+        "sim_upload": "Perfil de Consumo (CSV)",
+        "sim_rates": "Precios Fijos a Comparar (€/kWh)",
+        "sim_rates_help": "Uno o más precios sin IVA, separados por espacios o ';'.",
+        "sim_bad_file": "⚠️ No se pudo leer una lectura de kWh por fecha y hora en el archivo (sin franjas repetidas).",
+        "sim_bad_rates": "⚠️ No se pudieron leer los precios fijos.",
+        "sim_raw_info": "El simulador necesita una tarifa: desactiva el precio de mercado bruto.",
+        "sim_month": "Mes",
+        "sim_dynamic": "Dinámica",
+        "sim_fixed": "Fijo",
+        "sim_coverage": "Consumo con Precio",
+        "sim_dynamic_win": "✅ La tarifa dinámica es más barata que cualquier precio fijo.",
+        "sim_dynamic_loss": "❌ Un precio fijo habría salido más barato.",
         "table_title": "📋 Datos Horarios",
         "download_csv": "📥 Descargar CSV",
         "daily_summary": "Resumen Diario",
@@ -157,8 +302,15 @@ LANGUAGES = {
         "zone_punta": "Punta",
         "data_unavailable": "⚠️ Datos no disponibles para",
         "raw_info": "Mostrando datos crudos en €/MWh. Sin impuestos ni peajes.",
-        "hist_title": "Evolución de Precios (Últimos 30 Días)",
+        "hist_title": "Evolución de Precios",
         "hist_avg_note": "Mostrando precios medios diarios.",
+        "hist_month_note": "Mostrando precios medios mensuales.",
+        "hist_range": "Periodo",
+        "hist_avg": "Media",
+        "range_30d": "30 días",
+        "range_90d": "90 días",
+        "range_1y": "1 año",
+        "range_all": "Desde 2015",
         "explain_title": "📝 Desglose del Precio",
         "step_market": "1. Precio Mercado",
         "step_losses": "2. Añadir Pérdidas",
@@ -170,11 +322,15 @@ LANGUAGES = {
         "title": "⚡ Preço da Eletricidade (OMIE)",
         "config_title": "⚙️ **CONFIGURAR TARIFA** (Clique para Abrir)",
         "tab_daily": "📅 Visão Diária",
-        "tab_history": "📈 Tendência 30 Dias",
+        "tab_history": "📈 Tendência de Preços",
+        "tab_zones": "🌍 Zonas",
+        "tab_sim": "🧮 Simulador",
         "select_date": "Selecionar Data",
         "country": "País",
         "settings": "Configurações",
         "show_raw": "Ver Preço de Mercado (€/MWh)",
+        "quarter_hour": "Preços de 15 minutos",
+        "quarter_help": "Mostra os preços de mercado a cada 15 minutos em vez de médias horárias.",
         "comp_toggle": "Comparar com Taxa Fixa",
         "fixed_input": "Seu Preço Fixo (€/kWh)",
         "taxes": "Impostos e Taxas",
@@ -199,6 +355,37 @@ LANGUAGES = {
         "calc_cost": "Custo Estimado",
         "calc_start": "Melhor Início:",
         "view_table": "Ver Tabela de Dados",
+        "export_title": "📦 Exportação em Massa",
+        "export_range": "Intervalo de Datas",
+        "export_zones": "Zonas",
+        "export_format": "Formato",
+        "export_button": "Descarregar",
+        "forecast_toggle": "Previsão de Amanhã",
+        "forecast_help": "Antes da publicação das 13:30 CET, mostra preços estimados para amanhã a partir de um modelo do histórico guardado.",
+        "forecast_flag": "🔮 Preços estimados: os resultados do mercado de amanhã são publicados depois das 13:30 CET.",
+        "forecast_short": "(estimativa)",
+        "snap_live": "Personalizar tarifa, data e zona →",
+        "zones_title": "Comparação de Zonas de Licitação",
+        "zones_select": "Zonas",
+        "zones_note": "Preços diários brutos em €/MWh, em hora de mercado (CET).",
+        "zones_pick": "Escolha pelo menos uma zona.",
+        "zones_spread": "Diferencial Médio",
+        "zones_coupled": "Períodos Acoplados",
+        "zones_decoupled": "Períodos em que as zonas se desacoplam",
+        "sim_title": "Simulador de Custo Anual",
+        "sim_help": "Carregue um CSV do contador (uma linha por hora ou quarto de hora, com data e kWh) para comparar a tarifa dinâmica com preços fixos.",
+        "sim_upload": "Perfil de Consumo (CSV)",
+        "sim_rates": "Preços Fixos a Comparar (€/kWh)",
+        "sim_rates_help": "Um ou mais preços sem IVA, separados por espaços ou ';'.",
+        "sim_bad_file": "⚠️ Não foi possível ler uma leitura de kWh por data e hora no ficheiro (sem períodos repetidos).",
+        "sim_bad_rates": "⚠️ Não foi possível ler os preços fixos.",
+        "sim_raw_info": "O simulador precisa de uma tarifa: desative o preço de mercado bruto.",
+        "sim_month": "Mês",
+        "sim_dynamic": "Dinâmica",
+        "sim_fixed": "Fixo",
+        "sim_coverage": "Consumo com Preço",
+        "sim_dynamic_win": "✅ A tarifa dinâmica é mais barata do que qualquer preço fixo.",
+        "sim_dynamic_loss": "❌ Um preço fixo teria sido mais barato.",
         "table_title": "📋 Dados Horários",
         "download_csv": "📥 Baixar CSV",
         "daily_summary": "Resumo Diário",
@@ -223,8 +410,15 @@ LANGUAGES = {
         "zone_punta": "Ponta",
         "data_unavailable": "⚠️ Dados não disponíveis para",
         "raw_info": "Mostrando dados brutos em €/MWh. Sem impostos ou taxas.",
-        "hist_title": "Evolução de Preços (Últimos 30 Dias)",
+        "hist_title": "Evolução de Preços",
         "hist_avg_note": "Mostrando preços médios diários.",
+        "hist_month_note": "Mostrando preços médios mensais.",
+        "hist_range": "Período",
+        "hist_avg": "Média",
+        "range_30d": "30 dias",
+        "range_90d": "90 dias",
+        "range_1y": "1 ano",
+        "range_all": "Desde 2015",
         "explain_title": "📝 Composição do Preço",
         "step_market": "1. Preço Mercado",
         "step_losses": "2. Somar Perdas",
@@ -246,75 +440,227 @@ APPLIANCES = {
     "AC / Ar Condicionado": 1000
 }
 
-# --- Function to determine Tariff Period ---
-def get_tariff_period(hour, is_weekend, texts):
-    if is_weekend: return texts["zone_valle"], "rgba(0, 0, 255, 0.1)"
-    if 0 <= hour < 8: return texts["zone_valle"], "rgba(0, 0, 255, 0.1)"
-    elif (8 <= hour < 10) or (14 <= hour < 18) or (22 <= hour < 24): return texts["zone_llano"], "rgba(255, 255, 0, 0.1)"
-    else: return texts["zone_punta"], "rgba(255, 0, 0, 0.1)"
-
-def get_period_key(hour, is_weekend):
-    if is_weekend: return "P3"
-    if 0 <= hour < 8: return "P3"
-    elif (8 <= hour < 10) or (14 <= hour < 18) or (22 <= hour < 24): return "P2"
-    else: return "P1"
-
-def get_tariff_period_display(hour, is_weekend, texts):
-    key = get_period_key(hour, is_weekend)
-    if key == "P3": return texts["zone_valle"], "rgba(0, 0, 255, 0.1)"
-    elif key == "P2": return texts["zone_llano"], "rgba(255, 255, 0, 0.1)"
-    else: return texts["zone_punta"], "rgba(255, 0, 0, 0.1)"
-
 # --- DATA FUNCTIONS ---
-@st.cache_data(ttl=3600)
-def get_daily_prices(selected_date, country_code):
-    date_str = selected_date.strftime("%Y-%m-%d")
+HISTORY_RANGES = {"30d": 30, "90d": 90, "1y": 365, "all": None}     # days back; None is since HISTORY_START
+MONTHLY_AFTER = 400     # longer ranges are charted per month
+CHART_POINTS = 300      # about the trend chart's width in points
+COUNTRIES = ["Spain (ES)", "Portugal (PT)"]
+LANG_CODES = ("en", "es", "pt")     # by lang_idx, for snapshot names and <html lang>
+DEFAULT_TARIFF = TariffConfig(vat=URL_PARAMS["vat"][0] / 100, comm_fee=URL_PARAMS["comm_fee"][0], losses=URL_PARAMS["losses"][0] / 100,
+                              grid_p1=URL_PARAMS["grid_fixed"][0], grid_p2=URL_PARAMS["grid_fixed"][0], grid_p3=URL_PARAMS["grid_fixed"][0])
+DAILY_HOVER = {
+    True: "<b>%{customdata[0]}</b><br>Price: <b>%{y:.2f} €/MWh</b><extra></extra>",
+    False: "<b>%{customdata[0]}</b><br>Final: <b>%{y:.3f} €/kWh</b><br>Market Base: %{customdata[1]:.2f} €/MWh<extra></extra>",
+}
+
+def get_zone(country_code):
     bzn = "ES" if country_code == "Spain (ES)" else "PT"
-    target_tz = 'Europe/Lisbon' if bzn == "PT" else 'Europe/Madrid'
-    url = f"https://api.energy-charts.info/price?bzn={bzn}&start={date_str}&end={date_str}"
-    
+    return bzn, ZONE_TZ[bzn]
+
+@st.cache_resource
+def get_store():
+    store = PriceStore()
+    # Warms the store around publication time; set OMIE_PREFETCH=0 when running `python -m omie.prefetch` instead
+    if os.environ.get("OMIE_PREFETCH", "1") != "0":
+        start_prefetcher(store, on_ready=write_snapshots, on_day=alias_snapshots)
+    return store
+
+@st.cache_resource(ttl=3600, max_entries=4096)
+def load_day_series(bzn, day):
+    # Read-only float32 arrays shared by all sessions: a hit is a lookup, not an unpickled DataFrame
+    metrics.inc("omie_cache_misses_total", cache="day_series")
+    return get_store().load_series(bzn, day, day)
+
+def get_day_series(bzn, day):
+    metrics.inc("omie_cache_requests_total", cache="day_series")
+    return load_day_series(bzn, day)
+
+@metrics.timed("fetch")
+def get_price_window(end_date, country_code, days=0):
+    # One upstream call for all missing days, then shared per-day cache entries.
+    # Days that could not be fetched are never cached, so a failed refresh is retried on the next rerun.
+    bzn, _ = get_zone(country_code)
+    start_date = end_date - timedelta(days=days)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        if 'unix_seconds' not in data or 'price' not in data: return None, None
-        
-        df = pd.DataFrame({
-            'Timestamp': pd.to_datetime(data['unix_seconds'], unit='s').tz_localize('UTC').tz_convert(target_tz),
-            'Raw_Price_MWh': data['price']
-        })
-        df = df.set_index('Timestamp').resample('1h').mean().reset_index()
-        # Create clear Interval String
-        df['Hour_Start'] = df['Timestamp'].dt.strftime('%H:00')
-        df['Hour_End'] = (df['Timestamp'] + pd.Timedelta(hours=1)).dt.strftime('%H:00')
-        df['Hour_Range'] = df['Hour_Start'] + " - " + df['Hour_End']
-        df['Hour_Int'] = df['Timestamp'].dt.hour
-        return df, target_tz
-    except: return None, None
+        store = get_store()
+        store.backfill(bzn, start_date, end_date)
+        stored = store.stored_days(bzn, start_date, end_date)
+        return series_points([get_day_series(bzn, d) for d in sorted(stored)])
+    except: return None
+
+@metrics.timed("frame")
+def get_daily_prices(window, selected_date, country_code, minutes=60):
+    # Slots of `minutes`, or coarser when the day was published hourly; returns (df, tz, slot minutes)
+    _, target_tz = get_zone(country_code)
+    if window is None: return None, None, minutes
+    lo, hi = (pd.Timestamp(b, unit='s', tz='UTC') for b in day_bounds(selected_date, selected_date))
+    points = window[(window['Timestamp'] >= lo) & (window['Timestamp'] < hi)]
+    if points.empty: return None, None, minutes
+    minutes = max(minutes, native_minutes(points))
+    return daily_frame(points, target_tz, minutes), target_tz, minutes
+
+def get_next_day_prices(selected_date, country_code, tariff, minutes=60, estimate=False):
+    # Final prices of the following day if already stored (never blocks on the network), else
+    # with estimate the forecast, flagged in the Estimated column
+    bzn, target_tz = get_zone(country_code)
+    next_day = selected_date + timedelta(days=1)
+    try:
+        if next_day in get_store().stored_days(bzn, next_day, next_day):
+            points, estimated = series_points([get_day_series(bzn, next_day)]), False
+        elif estimate:
+            points, estimated = get_forecast_window(next_day, country_code), True
+        else: return None
+        if points is None: return None
+        next_df = daily_frame(points, target_tz, minutes)
+    except: return None
+    periods = period_index(next_df['Hour_Int'].to_numpy(), next_day.weekday() >= 5)
+    next_df['Display_Price'] = final_prices(next_df['Raw_Price_MWh'].to_numpy(), periods, tariff)
+    next_df['Estimated'] = estimated
+    return next_df
+
+@st.cache_resource
+def get_forecaster(bzn):
+    # One model per zone for the process, caught up one stored day at a time
+    return Forecaster()
+
+@st.cache_resource(ttl=3600, max_entries=64)
+def load_forecast_series(bzn, day):
+    forecaster = get_forecaster(bzn)
+    # Only stored days are used, so a rerun never waits on the network; the prefetcher keeps FIT_DAYS stored
+    with forecaster.lock, metrics.span("forecast"):
+        catch_up(forecaster, get_store(), bzn, day - timedelta(days=1))
+        # Quarter-hour points, so the estimate lines up with either resolution
+        points = forecast_points(forecaster, day, 900)
+    return None if points is None else price_series(*points)
+
+def get_forecast_window(day, country_code):
+    # Estimated hourly points of a day that is not published yet
+    bzn, _ = get_zone(country_code)
+    try: return series_points([load_forecast_series(bzn, day)])
+    except: return None
+
+@metrics.timed("fetch")
+def get_zone_prices(selected_date, zones, minutes=60):
+    # Every zone is fetched concurrently, then aligned on one UTC slot grid labelled in market time
+    try:
+        store = get_store()
+        store.backfill_zones(zones, selected_date, selected_date)
+        # Zones whose fetch failed are skipped rather than cached as empty
+        stored = [bzn for bzn in zones if selected_date in store.stored_days(bzn, selected_date, selected_date)]
+        return zone_frame({bzn: get_day_series(bzn, selected_date) for bzn in stored}, MARKET_TZ, minutes)
+    except: return None
 
 @st.cache_data(ttl=3600)
-def get_historical_prices(end_date, country_code, days=30):
-    start_date = end_date - timedelta(days=days)
-    start_str = start_date.strftime("%Y-%m-%d")
-    end_str = end_date.strftime("%Y-%m-%d")
-    bzn = "ES" if country_code == "Spain (ES)" else "PT"
-    url = f"https://api.energy-charts.info/price?bzn={bzn}&start={start_str}&end={end_str}"
-    
+def load_rollups(bzn, grain, start, end, stored=None):
+    # stored (days in the store) only keys the cache, so a newly filled range is not served stale
+    metrics.inc("omie_cache_misses_total", cache="rollups")
+    return get_store().load_rollups(bzn, grain, start, end)
+
+def get_rollups(bzn, grain, start, end, stored=None):
+    metrics.inc("omie_cache_requests_total", cache="rollups")
+    return load_rollups(bzn, grain, start, end, stored)
+
+def get_history(end_date, country_code, range_key, tariff=None):
+    # (daily rollups, rollups to chart) for the range; read from the rollup tables, never from raw points
+    bzn, _ = get_zone(country_code)
+    days = HISTORY_RANGES[range_key]
+    start_date = HISTORY_START if days is None else end_date - timedelta(days=days)
     try:
-        response = requests.get(url)
-        response.raise_for_status()
-        data = response.json()
-        if 'unix_seconds' not in data or 'price' not in data: return None
-        
-        df = pd.DataFrame({
-            'Timestamp': pd.to_datetime(data['unix_seconds'], unit='s'),
-            'Raw_Price_MWh': data['price']
-        })
-        df['Date'] = df['Timestamp'].dt.date
-        daily_avg = df.groupby('Date')['Raw_Price_MWh'].mean().reset_index()
-        return daily_avg
+        # Read-only: the prefetcher fills the history, and the stored-day count keys the cache so its progress shows
+        stored = len(get_store().stored_days(bzn, start_date, end_date))
+        daily = get_rollups(bzn, 'D', start_date, end_date, stored)
+        monthly = (end_date - start_date).days > MONTHLY_AFTER
+        chart = get_rollups(bzn, 'M', start_date, end_date, stored) if monthly else daily
+    except: return None, None
+    if daily.empty: return None, None
+    for hist in {id(daily): daily, id(chart): chart}.values():
+        if tariff is None: hist['Display_Price'] = hist['Raw_Price_MWh']
+        else: hist['Display_Price'] = average_final_prices(hist['Raw_Price_MWh'], hist[['P1_Hours', 'P2_Hours', 'P3_Hours']], tariff)
+    return daily, chart
+
+@st.cache_data(ttl=3600, max_entries=16)
+def load_profile(data, tz_name):
+    # Parsing is most of a simulation's time; re-running with other rates or tariffs reuses it
+    return read_profile(io.BytesIO(data), tz_name)
+
+def snapshot_frame(snapshot):
+    # (df, tz, slot minutes) as the daily view builds them, tariff columns included
+    df = pd.DataFrame(snapshot['frame'])
+    df['Timestamp'] = pd.to_datetime(df['Timestamp'], unit='s', utc=True).dt.tz_convert(snapshot['tz'])
+    return add_hour_labels(df, snapshot['minutes']), snapshot['tz'], snapshot['minutes']
+
+def build_snapshot(day, country_code, lang):
+    # Default-tariff daily and 30-day views as (payload, html page); None until the whole day is stored
+    t = LANGUAGES[lang]
+    df, tz, minutes = get_daily_prices(get_price_window(day, country_code), day, country_code)
+    if df is None or df['Timestamp'].iloc[-1].timestamp() + minutes * 60 < day_bounds(day, day)[1]: return None
+    is_weekend = day.weekday() >= 5
+    periods = period_index(df['Hour_Int'].to_numpy(), is_weekend)
+    df['Grid_Fee_Applied'] = DEFAULT_TARIFF.grid_fees[periods]
+    df['Display_Price'] = final_prices(df['Raw_Price_MWh'].to_numpy(), periods, DEFAULT_TARIFF)
+    layout = daily_layout(is_weekend, False, t['hour_axis'], (t['zone_punta'], t['zone_llano'], t['zone_valle']), 60 // minutes)
+    daily = daily_figure(layout, df['Hour_Start'].tolist(), df['Display_Price'].tolist(),
+                         list(zip(df['Hour_Range'], df['Raw_Price_MWh'].tolist())), f"PVPC - {day}", DAILY_HOVER[False])
+    figures = [daily]
+    hist_df, chart_df = get_history(day, country_code, "30d", DEFAULT_TARIFF)
+    if hist_df is not None: figures.append(history_figure(chart_df, "€/kWh", t).to_plotly_json())
+    best = df['Display_Price'].idxmin()
+    summary = [(t["avg_price"], f"{df['Display_Price'].mean():.3f} €"),
+               (t["min_price"], f"{df.loc[best, 'Display_Price']:.3f} € ({df.loc[best, 'Hour_Range']})"),
+               (t["max_price"], f"{df['Display_Price'].max():.3f} €")]
+    lang_idx = lang_options.index(lang)
+    payload = {
+        'day': day.isoformat(), 'zone': country_code, 'lang': LANG_CODES[lang_idx], 'tz': tz, 'minutes': minutes,
+        'frame': {'Timestamp': [int(ts.timestamp()) for ts in df['Timestamp']],
+                  **{c: df[c].tolist() for c in ('Raw_Price_MWh', 'Grid_Fee_Applied', 'Display_Price')}},
+    }
+    page = render_page(f"{t['title']} - {country_code} - {day}", LANG_CODES[lang_idx], summary, figures,
+                       f"/?lang_idx={lang_idx}", t["snap_live"])
+    return payload, page
+
+def write_default_snapshot(day, country_code, lang, current=None):
+    built = build_snapshot(day, country_code, lang)
+    if built is None: return None
+    bzn, _ = get_zone(country_code)
+    code = LANG_CODES[lang_options.index(lang)]
+    # <zone>_<lang>.html always holds today's page, for a proxy to serve on the bare URL
+    if current is None: current = day == date.today()
+    write_snapshot(snapshot_dir(), snapshot_name(day, bzn, code), *built, alias=f"{bzn}_{code}" if current else None)
+    return built[0]
+
+def write_snapshots(days):
+    # Publication hook of the prefetcher: every zone and language of each day
+    for day in days:
+        for country_code in COUNTRIES:
+            for lang in lang_options:
+                write_default_snapshot(day, country_code, lang)
+
+def alias_snapshots(day):
+    # Day hook of the prefetcher: at midnight <zone>_<lang>.html moves on to the new day's page
+    for country_code in COUNTRIES:
+        bzn, _ = get_zone(country_code)
+        for lang in lang_options:
+            code = LANG_CODES[lang_options.index(lang)]
+            if not alias_snapshot(snapshot_dir(), snapshot_name(day, bzn, code), f"{bzn}_{code}"):
+                write_default_snapshot(day, country_code, lang, current=True)
+
+def get_snapshot(day, country_code, lang):
+    # The day's snapshot; the first default visitor of a day without one renders it for everyone
+    bzn, _ = get_zone(country_code)
+    snapshot = read_snapshot(snapshot_dir(), snapshot_name(day, bzn, LANG_CODES[lang_options.index(lang)]))
+    metrics.inc("omie_snapshot_requests_total", result="hit" if snapshot is not None else "miss")
+    if snapshot is not None: return snapshot
+    try: return write_default_snapshot(day, country_code, lang)
     except: return None
 
+@st.cache_resource
+def start_api_server():
+    # Read-only JSON prices on OMIE_API_PORT (/api/prices), answered without a rerun
+    port = os.environ.get("OMIE_API_PORT")
+    return api.serve(int(port), get_store()) if port else None
+
+start_api_server()
+
 # --- MAIN APP START ---
 st.title("⚡ Iberian Electricity Prices")
 
@@ -324,6 +670,8 @@ safe_idx = default_lang_idx if 0 <= default_lang_idx < 3 else 2
 
 t_pre = LANGUAGES[lang_options[safe_idx]]
 
+url_state = {}
+
 with st.expander(t_pre["config_title"], expanded=False):
     # Column Layout for Settings
     col_set1, col_set2, col_set3 = st.columns([1, 1, 1])
@@ -332,9 +680,13 @@ with st.expander(t_pre["config_title"], expanded=False):
         st.markdown("##### 🌍 Region")
         lang_choice = st.selectbox("Language / Idioma", lang_options, index=safe_idx)
         t = LANGUAGES[lang_choice] 
-        st.query_params["lang_idx"] = lang_options.index(lang_choice)
+        url_state["lang_idx"] = lang_options.index(lang_choice)
         
         show_raw = st.toggle(t["show_raw"], value=False, help=t["raw_info"])
+        quarter_hour = st.toggle(t["quarter_hour"], value=default_quarter_hour, help=t["quarter_help"])
+        url_state["quarter_hour"] = quarter_hour
+        show_forecast = st.toggle(t["forecast_toggle"], value=default_forecast, help=t["forecast_help"])
+        url_state["forecast"] = show_forecast
         show_calculator = st.toggle(t["calc_title"], value=True)
 
     fixed_price_final = 0.0
@@ -345,23 +697,23 @@ with st.expander(t_pre["config_title"], expanded=False):
         with col_set2:
             st.markdown("##### 🧾 Tariff")
             show_fixed = st.toggle(t["comp_toggle"], value=default_show_fixed_comp)
-            st.query_params["show_fixed_comp"] = str(show_fixed)
+            url_state["show_fixed_comp"] = show_fixed
             
             if show_fixed:
                 fixed_val_input = st.number_input(t["fixed_input"], value=default_fixed_val, step=0.001, format="%.3f")
-                st.query_params["fixed_val"] = fixed_val_input
+                url_state["fixed_val"] = fixed_val_input
             
             comm_input = st.number_input(t["comm_fee_label"], value=default_comm_fee, step=0.001, format="%.3f", help=t["comm_help"])
-            st.query_params["comm_fee"] = comm_input
+            url_state["comm_fee"] = comm_input
             
             losses_input = st.number_input(t["losses_label"], value=default_losses, step=0.01, format="%.2f", help=t["losses_help"])
-            st.query_params["losses"] = losses_input
+            url_state["losses"] = losses_input
             losses_val = losses_input / 100
 
         with col_set3:
             st.markdown(f"##### 🏛️ {t['taxes']}")
             tax_input = st.number_input(t["vat"], value=default_vat, step=1.0)
-            st.query_params["vat"] = tax_input
+            url_state["vat"] = tax_input
             tax_value = tax_input / 100
             
             st.markdown(f"**{t['grid_fee_label']}**", help=t["grid_help"])
@@ -372,12 +724,12 @@ with st.expander(t_pre["config_title"], expanded=False):
             grid_fee_p1, grid_fee_p2, grid_fee_p3 = 0.0, 0.0, 0.0
             
             if grid_type_sel == t["grid_type_fixed"]:
-                st.query_params["grid_type"] = "Fixed"
+                url_state["grid_type"] = "Fixed"
                 grid_fixed_val = st.number_input(t["grid_fixed_input"], value=default_grid_fixed, step=0.001, format="%.3f")
-                st.query_params["grid_fixed"] = grid_fixed_val
+                url_state["grid_fixed"] = grid_fixed_val
                 grid_fee_p1 = grid_fee_p2 = grid_fee_p3 = grid_fixed_val
             else:
-                st.query_params["grid_type"] = "Variable"
+                url_state["grid_type"] = "Variable"
                 sc1, sc2, sc3 = st.columns(3)
                 with sc1:
                     grid_fee_p1 = st.number_input("P1", value=default_grid_p1, step=0.001, format="%.3f", help=t["grid_p1_input"])
@@ -386,241 +738,407 @@ with st.expander(t_pre["config_title"], expanded=False):
                 with sc3:
                     grid_fee_p3 = st.number_input("P3", value=default_grid_p3, step=0.001, format="%.3f", help=t["grid_p3_input"])
                 
-                st.query_params["grid_p1"] = grid_fee_p1
-                st.query_params["grid_p2"] = grid_fee_p2
-                st.query_params["grid_p3"] = grid_fee_p3
+                url_state["grid_p1"] = grid_fee_p1
+                url_state["grid_p2"] = grid_fee_p2
+                url_state["grid_p3"] = grid_fee_p3
 
         if show_fixed:
             fixed_price_final = fixed_val_input * (1 + tax_value)
 
+        tariff = TariffConfig(vat=tax_value, comm_fee=comm_input, losses=losses_val, grid_p1=grid_fee_p1, grid_p2=grid_fee_p2, grid_p3=grid_fee_p3)
+
+sync_query_params(url_state)
+# Default settings (in any language and zone) are hydrated from the pre-rendered snapshot
+default_view = not show_raw and all(url_state[k] == URL_PARAMS[k][0] for k in url_state if k != "lang_idx")
+
 # Date Blocker
 now_cet = datetime.now(pytz.timezone('Europe/Madrid'))
-if now_cet.hour > 13 or (now_cet.hour == 13 and now_cet.minute >= 30):
+if (now_cet.hour, now_cet.minute) >= PUBLICATION_TIME:
     max_allowed = now_cet.date() + timedelta(days=1)
 else:
     max_allowed = now_cet.date()
+# Before publication tomorrow can still be picked, with forecast prices
+max_pick = max_allowed + timedelta(days=1) if show_forecast and max_allowed == now_cet.date() else max_allowed
 
 col1, col2 = st.columns(2)
 with col1:
-    day_select = st.date_input(t["select_date"], date.today(), max_value=max_allowed)
+    day_select = st.date_input(t["select_date"], date.today(), max_value=max_pick)
 with col2:
     default_country_idx = 1 if lang_choice == "Português" else 0
-    country_choice = st.radio(t["country"], ["Spain (ES)", "Portugal (PT)"], index=default_country_idx, horizontal=True)
+    country_choice = st.radio(t["country"], COUNTRIES, index=default_country_idx, horizontal=True)
 
-# --- TABS LAYOUT ---
-tab1, tab2 = st.tabs([t["tab_daily"], t["tab_history"]])
+# --- SECTIONS ---
+# Each section is a fragment: its own widgets only rerun that section.
+@st.fragment
+@metrics.timed("chart")
+def render_daily_chart(df, day_select, current_tz, t, show_raw, compare_fixed, fixed_price_final, unit_label, title_label, minutes=60):
+    # Bands, legend and axes are cached per (weekend, raw/final, language, resolution); only the bars change per rerun
+    layout = daily_layout(day_select.weekday() >= 5, show_raw, t['hour_axis'], (t['zone_punta'], t['zone_llano'], t['zone_valle']), 60 // minutes)
+    
+    now_x = None
+    if day_select == date.today():
+        now_x = slot_label(datetime.now(pytz.timezone(current_tz)), minutes)
 
-# === TAB 1: DAILY VIEW ===
-with tab1:
-    df, current_tz = get_daily_prices(day_select, country_choice)
-
-    if df is not None and not df.empty:
-        # --- CALCULATION LOGIC ---
-        if show_raw:
-            df['Display_Price'] = df['Raw_Price_MWh']
-            unit_label, chart_colors = "€/MWh", "RdYlGn_r"
-            fmt_str = "{:.2f} €" 
-            title_label = "MWh"
-        else:
-            unit_label = "€/kWh"
-            fmt_str = "{:.3f} €" 
-            title_label = "PVPC"
-            chart_colors = "RdYlGn_r"
-            
-            is_weekend = day_select.weekday() >= 5
-            def apply_grid_fee(row):
-                p_key = get_period_key(row['Hour_Int'], is_weekend)
-                if p_key == "P1": return grid_fee_p1
-                if p_key == "P2": return grid_fee_p2
-                return grid_fee_p3
-
-            df['Grid_Fee_Applied'] = df.apply(apply_grid_fee, axis=1)
-            # Core Formula
-            df['Display_Price'] = (
-                ((df['Raw_Price_MWh'] / 1000) * (1 + losses_val)) 
-                + comm_input 
-                + df['Grid_Fee_Applied']
-            ) * (1 + tax_value)
-
-        # --- LIVE STATUS ---
-        if day_select == date.today():
-            now_local = datetime.now(pytz.timezone(current_tz))
-            curr_row = df.loc[df['Hour_Int'] == now_local.hour]
-            if not curr_row.empty:
-                cp = curr_row['Display_Price'].values[0]
-                avg = df['Display_Price'].mean()
-                
-                if not show_raw and show_fixed:
-                    if cp < fixed_price_final:
-                        v_txt, v_col = t["verdict_fixed_win"], "green"
-                        delta_val = cp - fixed_price_final
-                    else:
-                        v_txt, v_col = t["verdict_fixed_loss"], "red"
-                        delta_val = cp - fixed_price_final
-                    delta_text = f"{delta_val:.2f} vs Fixed"
-                else:
-                    if cp < avg * 0.9: v_txt, v_col = t["verdict_good"], "green"
-                    elif cp > avg * 1.1: v_txt, v_col = t["verdict_bad"], "red"
-                    else: v_txt, v_col = t["verdict_avg"], "orange"
-                    delta_text = f"{cp - avg:.2f} vs Avg"
-
-                st.markdown(f"### {t['now_label']} ({now_local.strftime('%H:%M')})")
-                c1, c2 = st.columns([1, 2])
-                c1.metric(t['price_axis'], fmt_str.format(cp), delta=delta_text, delta_color="inverse")
-                c2.markdown(f"#### :{v_col}[{v_txt}]")
-                st.divider()
-
-        avg_price = df['Display_Price'].mean()
-        min_price = df['Display_Price'].min()
-        max_price = df['Display_Price'].max()
-        best_h_idx = df['Display_Price'].idxmin()
-        best_h_range = df.loc[best_h_idx, 'Hour_Range']
-
-        st.markdown(f"### 📊 {t['daily_summary']} ({unit_label})")
-        m1, m2, m3 = st.columns(3)
-        m1.metric(t["avg_price"], fmt_str.format(avg_price))
-        m2.metric(t["min_price"], fmt_str.format(min_price), f"at {best_h_range}", delta_color="inverse")
-        m3.metric(t["max_price"], fmt_str.format(max_price), delta_color="normal")
-
-        # --- FORMULA EXPLAINER (Mobile Friendly Vertical List) ---
-        if not show_raw:
-            with st.expander(t["explain_title"]):
-                avg_mkt = df['Raw_Price_MWh'].mean() / 1000
-                avg_grid = df['Grid_Fee_Applied'].mean()
-                
-                # Steps logic calculation
-                val_market = avg_mkt
-                val_losses = avg_mkt * losses_val
-                val_base = val_market + val_losses
-                val_fees = comm_input + avg_grid
-                val_subtotal = val_base + val_fees
-                val_final = val_subtotal * (1 + tax_value)
-
-                st.markdown(f"""
-                **{t['step_market']}:** {val_market:.3f} €
-                ⬇
-                **{t['step_losses']} (+{losses_input}%):** {val_losses:.3f} €
-                ⬇
-                **{t['step_comm']}:** {val_fees:.3f} €
-                ⬇
-                **{t['step_tax']} (+{int(tax_value*100)}%):**
-                ⬇
-                **{t['step_final']}:** :green[{val_final:.3f} €/kWh]
-                """)
-
-        st.markdown("---")
-        
-        # --- CHART ---
-        fig = px.bar(
-            df, 
-            x="Hour_Start", 
-            y="Display_Price", 
-            color="Display_Price", 
-            color_continuous_scale=chart_colors, 
-            title=f"{title_label} - {day_select}", 
-            labels={"Display_Price": f"{t['price_axis']} ({unit_label})", "Hour_Start": t['hour_axis']},
-            custom_data=['Hour_Range', 'Raw_Price_MWh']
-        )
+    fig = daily_figure(
+        layout,
+        df['Hour_Start'].tolist(),
+        df['Display_Price'].tolist(),
+        list(zip(df['Hour_Range'], df['Raw_Price_MWh'].tolist())),
+        f"{title_label} - {day_select}",
+        DAILY_HOVER[show_raw],
+        now_x=now_x,
+        fixed_rate=fixed_price_final if compare_fixed else None,
+        fixed_label=f"{t['your_rate']} ({fixed_price_final:.2f})",
+    )
+    st.plotly_chart(fig, width="stretch", config={'displayModeBar': False})
+
+@st.fragment
+@metrics.timed("calculator")
+def render_calculator(df, day_select, country_choice, tariff, t, fmt_str, minutes=60, estimate=False):
+    st.markdown(f"### {t['calc_title']}")
+    c1, c2, c3 = st.columns(3)
+    with c1: 
+        app_list = list(APPLIANCES.keys())
+        selected_app = st.selectbox(t["calc_appliance"], app_list, index=0)
+        preset_power = APPLIANCES[selected_app]
         
-        # FIXED TOOLTIP: Clean, no duplicate hour header
-        if show_raw:
-             fig.update_traces(hovertemplate="<b>%{customdata[0]}</b><br>Price: <b>%{y:.2f} €/MWh</b><extra></extra>")
+        if preset_power == 0:
+            ap = st.number_input(t["calc_power"], value=2000, step=100)
         else:
-             fig.update_traces(hovertemplate="<b>%{customdata[0]}</b><br>Final: <b>%{y:.3f} €/kWh</b><br>Market Base: %{customdata[1]:.2f} €/MWh<extra></extra>")
-
-        if not show_raw and show_fixed:
-            fig.add_hline(y=fixed_price_final, line_dash="dash", line_color="#2E86C1", line_width=3, annotation_text=f"{t['your_rate']} ({fixed_price_final:.2f})")
+            ap = st.number_input(t["calc_power"], value=preset_power)
+            
+    with c2: dh = st.number_input(t["calc_duration"], value=2.0, min_value=0.25, step=0.25)
+    
+    # Runs may cross midnight into the next day once its prices are stored (or forecast, with estimate)
+    horizon = df[['Timestamp', 'Hour_Range', 'Display_Price']]
+    next_df = get_next_day_prices(day_select, country_choice, tariff, minutes, estimate)
+    if next_df is not None:
+        horizon = pd.concat([horizon, next_df[['Timestamp', 'Hour_Range', 'Display_Price']]], ignore_index=True)
+    plan = schedule(horizon['Display_Price'].to_numpy(), [Load("run", ap, dh)], slot_hours=minutes / 60)
+    if plan is not None:
+        best_idx = plan.starts["run"]
+        best_label = horizon.loc[best_idx, 'Hour_Range']
+        if best_idx >= len(df):
+            best_label += f" ({horizon.loc[best_idx, 'Timestamp']:%d/%m})"
+            if next_df['Estimated'].iloc[0]: best_label += f" {t['forecast_short']}"
+        with c3:
+            st.success(f"**{t['calc_start']}** {best_label}")
+            st.metric(t["calc_cost"], fmt_str.format(plan.total_cost))
 
+@st.fragment
+@metrics.timed("table")
+def render_data_table(df, t, show_raw, unit_label):
+    # Only built once the expander is opened
+    table_box = st.expander(t["view_table"], key="table_open", on_change="rerun")
+    if not table_box.open: return
+    with table_box:
+        view_df = df[['Hour_Range', 'Display_Price']].copy()
+        view_df.columns = [t['interval_col'], f"{t['price_col']} ({unit_label})"]
         if not show_raw:
-            is_weekend = day_select.weekday() >= 5
-            for i in range(24):
-                p_name, bg_col = get_tariff_period_display(i, is_weekend, t)
-                fig.add_shape(type="rect", x0=i-0.5, x1=i+0.5, y0=0, y1=1, xref="x", yref="paper", fillcolor=bg_col, line_width=0, layer="below")
-            
-            if not is_weekend:
-                fig.add_annotation(x=3, y=1.07, text=f"🟦 {t['zone_valle']}", showarrow=False, xref="x", yref="paper", font=dict(color="blue", size=10))
-                fig.add_annotation(x=10, y=1.07, text=f"𝟨 {t['zone_llano']}", showarrow=False, xref="x", yref="paper", font=dict(color="#b5b500", size=10))
-                fig.add_annotation(x=17, y=1.07, text=f"🟥 {t['zone_punta']}", showarrow=False, xref="x", yref="paper", font=dict(color="red", size=10))
-            else:
-                fig.add_annotation(x=12, y=1.07, text=f"🟦 {t['zone_valle']}", showarrow=False, xref="x", yref="paper", font=dict(color="blue", size=10))
-        
-        if day_select == date.today():
-            now_str = datetime.now(pytz.timezone(current_tz)).strftime('%H:00')
-            fig.add_vline(x=now_str, line_width=2, line_dash="dash", line_color="black")
-
-        fig.update_layout(xaxis=dict(fixedrange=True, title=t['hour_axis']), yaxis=dict(fixedrange=True, title=None), coloraxis_showscale=False, hovermode="x unified", margin=dict(l=10, r=10, t=50, b=10))
-        st.plotly_chart(fig, width="stretch", config={'displayModeBar': False})
-
-        # --- CALCULATOR ---
-        if show_calculator and not show_raw:
-            st.markdown(f"### {t['calc_title']}")
-            c1, c2, c3 = st.columns(3)
-            with c1: 
-                app_list = list(APPLIANCES.keys())
-                selected_app = st.selectbox(t["calc_appliance"], app_list, index=0)
-                preset_power = APPLIANCES[selected_app]
-                
-                if preset_power == 0:
-                    ap = st.number_input(t["calc_power"], value=2000, step=100)
-                else:
-                    ap = st.number_input(t["calc_power"], value=preset_power)
-                    
-            with c2: dh = st.number_input(t["calc_duration"], value=2, min_value=1)
-            
-            df['Roll'] = df['Display_Price'].rolling(window=dh).mean().shift(1 - dh)
-            if not df['Roll'].dropna().empty:
-                cost = (ap/1000)*dh*df['Roll'].min()
-                with c3:
-                    best_idx = df['Roll'].idxmin()
-                    st.success(f"**{t['calc_start']}** {df.loc[best_idx, 'Hour_Range']}")
-                    st.metric(t["calc_cost"], fmt_str.format(cost))
-
-        # --- DATA TABLE ---
-        st.markdown(f"### {t['table_title']}")
-        with st.expander(t["view_table"]):
-            view_df = df[['Hour_Range', 'Display_Price']].copy()
-            view_df.columns = [t['interval_col'], f"{t['price_col']} ({unit_label})"]
-            if not show_raw:
-                view_df[f"{t['base_col']} (€/MWh)"] = df['Raw_Price_MWh']
-            st.dataframe(view_df.style.format(precision=3), width="stretch", hide_index=True)
-    else:
-        st.error(f"{t['data_unavailable']} {day_select}.")
+            view_df[f"{t['base_col']} (€/MWh)"] = df['Raw_Price_MWh']
+        st.dataframe(view_df.style.format(precision=3), width="stretch", hide_index=True)
 
-# === TAB 2: HISTORY VIEW ===
-with tab2:
-    hist_df = get_historical_prices(day_select, country_choice)
+def history_figure(chart_df, h_unit, t, raw=False):
+    # Multi-year daily series are thinned to about the chart width, keeping each bucket's peaks
+    plot_df = downsample(chart_df, 'Display_Price', CHART_POINTS)
+    fig_h = px.line(plot_df, x="Date", y="Display_Price", markers=len(plot_df) <= 90, title=f"Average {h_unit}", labels={"Display_Price": t['price_axis'], "Date": t['date_axis']})
+    # CLEAN TOOLTIP FOR HISTORY
+    fig_h.update_traces(hovertemplate="Price: <b>%{y:.3f} " + h_unit + "</b><extra></extra>")
+    if raw:
+        # Raw view: P10-P90 band of the hourly prices behind each point
+        fig_h.add_scatter(x=plot_df['Date'], y=plot_df['P90'], mode="lines", line=dict(width=0), hoverinfo="skip", showlegend=False)
+        fig_h.add_scatter(x=plot_df['Date'], y=plot_df['P10'], mode="lines", line=dict(width=0), fill="tonexty",
+                          fillcolor="rgba(46, 134, 193, 0.15)", hoverinfo="skip", showlegend=False)
+    fig_h.update_layout(xaxis=dict(fixedrange=True), yaxis=dict(fixedrange=True), hovermode="x unified")
+    return fig_h
+
+@st.fragment
+@metrics.timed("history")
+def render_history(day_select, country_choice, tariff, t):
+    range_key = st.radio(t["hist_range"], list(HISTORY_RANGES), format_func=lambda k: t[f"range_{k}"], horizontal=True, key="hist_range")
+    hist_df, chart_df = get_history(day_select, country_choice, range_key, tariff)
     if hist_df is not None:
-        if show_raw:
-            hist_df['Display_Price'] = hist_df['Raw_Price_MWh']
+        if tariff is None:
             h_unit = "€/MWh"
             fmt_hist = "{:.2f} €"
         else:
             h_unit = "€/kWh"
             fmt_hist = "{:.3f} €"
-            if st.query_params.get("grid_type") == "Fixed": proxy_grid = default_grid_fixed
-            else: proxy_grid = default_grid_p2 
-            
-            hist_df['Display_Price'] = (
-                ((hist_df['Raw_Price_MWh'] / 1000) * (1 + losses_val)) 
-                + comm_input + proxy_grid
-            ) * (1 + tax_value)
 
         st.markdown(f"### {t['hist_title']}")
-        st.caption(t['hist_avg_note'])
+        st.caption(t['hist_avg_note'] if chart_df is hist_df else t['hist_month_note'])
         
-        fig_h = px.line(hist_df, x="Date", y="Display_Price", markers=True, title=f"Average {h_unit}", labels={"Display_Price": t['price_axis'], "Date": t['date_axis']})
-        # CLEAN TOOLTIP FOR HISTORY
-        fig_h.update_traces(hovertemplate="Price: <b>%{y:.3f} " + h_unit + "</b><extra></extra>")
-        fig_h.update_layout(xaxis=dict(fixedrange=True), yaxis=dict(fixedrange=True), hovermode="x unified")
-        st.plotly_chart(fig_h, width="stretch", config={'displayModeBar': False})
+        st.plotly_chart(history_figure(chart_df, h_unit, t, raw=tariff is None), width="stretch", config={'displayModeBar': False})
         
         h_avg = hist_df['Display_Price'].mean()
         h_min = hist_df['Display_Price'].min()
         h_max = hist_df['Display_Price'].max()
         
         hc1, hc2, hc3 = st.columns(3)
-        hc1.metric(f"30-Day Avg", fmt_hist.format(h_avg))
+        hc1.metric(f"{t['hist_avg']} ({t[f'range_{range_key}']})", fmt_hist.format(h_avg))
         hc2.metric("Min (Day)", fmt_hist.format(h_min))
         hc3.metric("Max (Day)", fmt_hist.format(h_max))
     else:
         st.warning("History data not available.")
+
+@st.fragment
+@metrics.timed("export")
+def render_export(day_select, tariff, quarter_hour, t):
+    # Any range and zones; the file is only built, chunk by chunk, when the button is clicked
+    export_box = st.expander(t["export_title"], key="export_open", on_change="rerun")
+    if not export_box.open: return
+    with export_box:
+        e1, e2, e3 = st.columns(3)
+        # A forecast day has nothing to export, so the default range stops at the last published day
+        last = min(day_select, max_allowed)
+        with e1: export_range = st.date_input(t["export_range"], (last - timedelta(days=30), last), min_value=HISTORY_START, max_value=max_allowed)
+        # The tariff is Iberian, so other zones are only offered as raw prices
+        with e2: zones = st.multiselect(t["export_zones"], list(ZONE_TZ) if tariff is None else list(MIBEL_ZONES), default=list(MIBEL_ZONES))
+        with e3: fmt = st.radio(t["export_format"], ["CSV", "Parquet"], horizontal=True)
+        if len(export_range) != 2 or not zones: return
+        start, end = export_range
+        seconds = 900 if quarter_hour else 3600
+
+        ext, mime = ("csv", "text/csv") if fmt == "CSV" else ("parquet", "application/octet-stream")
+
+        def build():
+            # Chunks stream to a temp file; download_button takes the open reader (not a spooled file)
+            chunks = iter_chunks(get_store(), zones, start, end, tariff, seconds=seconds)
+            with tempfile.NamedTemporaryFile(suffix=f".{ext}", delete=False) as f: path = f.name
+            try:
+                if fmt == "CSV":
+                    with open(path, "w", encoding="utf-8", newline="") as text: write_csv(chunks, text)
+                else:
+                    write_parquet(chunks, path)
+                return open(path, "rb")
+            finally:
+                os.unlink(path)     # the open reader keeps the data until Streamlit has read it
+
+        st.download_button(t["export_button"], build, file_name=f"omie_{'_'.join(zones)}_{start}_{end}.{ext}", mime=mime, on_click="ignore")
+
+@st.fragment
+@metrics.timed("simulator")
+def render_simulator(country_choice, tariff, default_rate, t):
+    # Whole load curve priced against every tariff and fixed rate in one vectorized pass
+    st.markdown(f"### {t['sim_title']}")
+    st.caption(t['sim_help'])
+    s1, s2 = st.columns(2)
+    with s1: upload = st.file_uploader(t["sim_upload"], type=["csv", "txt"])
+    with s2: rates_text = st.text_input(t["sim_rates"], f"{default_rate:.3f}", help=t["sim_rates_help"])
+    if upload is None: return
+    try: rates = [float(r.replace(",", ".")) for r in rates_text.replace(";", " ").split()]
+    except ValueError: rates = []
+    if not rates:
+        st.warning(t["sim_bad_rates"])
+        return
+    bzn, target_tz = get_zone(country_choice)
+    try: ts, kwh, step = load_profile(upload.getvalue(), target_tz)
+    except: ts = []
+    if not len(ts):
+        st.error(t["sim_bad_file"])
+        return
+
+    market_tz = pytz.timezone('Europe/Madrid')
+    start = datetime.fromtimestamp(int(ts[0]), market_tz).date()
+    end = min(datetime.fromtimestamp(int(ts[-1]), market_tz).date(), max_allowed)
+    store = get_store()
+    try: store.backfill(bzn, start, end)
+    except: pass
+    raw = slot_prices(*store.load_arrays(bzn, start, end), ts, step)
+    sim = simulate(ts, kwh, raw, target_tz, [tariff], rates, tariff.vat)
+
+    dynamic_total, fixed_totals = sim.dynamic_total[0], sim.fixed_total
+    m1, m2, m3 = st.columns(3)
+    m1.metric(t["sim_dynamic"], f"{dynamic_total:,.2f} €")
+    m2.metric(f"{t['sim_fixed']} ({rates[fixed_totals.argmin()]:.3f})", f"{fixed_totals.min():,.2f} €",
+              delta=f"{fixed_totals.min() - dynamic_total:,.2f} €", delta_color="off")
+    m3.metric(t["sim_coverage"], f"{sim.coverage:.1%}")
+    if dynamic_total < fixed_totals.min(): st.markdown(f"#### :green[{t['sim_dynamic_win']}]")
+    else: st.markdown(f"#### :red[{t['sim_dynamic_loss']}]")
+
+    table = pd.DataFrame({t["sim_month"]: sim.months, "kWh": sim.kwh, f"{t['sim_dynamic']} (€)": sim.dynamic[0]})
+    for rate, costs in zip(rates, sim.fixed):
+        table[f"{t['sim_fixed']} {rate:.3f} (€)"] = costs
+    st.dataframe(table.style.format(precision=2), width="stretch", hide_index=True)
+
+@st.fragment
+@metrics.timed("zones")
+def render_zones(day_select, country_choice, quarter_hour, t):
+    home, _ = get_zone(country_choice)
+    others = [bzn for bzn in ZONE_TZ if bzn != home]
+    zones = st.multiselect(t["zones_select"], [home] + others, default=[home] + others[:2], key="zones")
+    if not zones:
+        st.info(t["zones_pick"])
+        return
+    zone_df = get_zone_prices(day_select, zones, 15 if quarter_hour else 60)
+    if zone_df is None:
+        st.error(f"{t['data_unavailable']} {day_select}.")
+        return
+    zones = [bzn for bzn in zones if bzn in zone_df]
+
+    st.markdown(f"### {t['zones_title']}")
+    st.caption(t["zones_note"])
+    fig_z = px.line(zone_df, x="Hour_Start", y=zones, title=f"€/MWh - {day_select}",
+                    labels={"Hour_Start": t['hour_axis'], "value": t['price_axis'], "variable": t['zones_select']})
+    fig_z.update_traces(hovertemplate="%{y:.2f} €/MWh")
+    fig_z.update_layout(xaxis=dict(fixedrange=True), yaxis=dict(fixedrange=True), hovermode="x unified")
+    st.plotly_chart(fig_z, width="stretch", config={'displayModeBar': False})
+
+    # Spread of each zone against the selected country; Coupled is across all the zones shown
+    away = [bzn for bzn in zones if bzn != home] if home in zones else []
+    cols = st.columns(len(away) + 1)
+    cols[0].metric(t["zones_coupled"], f"{int(zone_df['Coupled'].sum())} / {len(zone_df)}")
+    for col, bzn in zip(cols[1:], away):
+        col.metric(f"{t['zones_spread']} {bzn} - {home}", f"{(zone_df[bzn] - zone_df[home]).mean():.2f} €")
+    decoupled = zone_df.loc[~zone_df['Coupled'], ['Hour_Range'] + zones + ['Spread']]
+    if len(zones) > 1 and not decoupled.empty:
+        with st.expander(f"{t['zones_decoupled']} ({len(decoupled)})"):
+            st.dataframe(decoupled.rename(columns={'Hour_Range': t['interval_col']}).style.format(precision=2), width="stretch", hide_index=True)
+
+# --- TABS LAYOUT ---
+# Stateful tabs: only the open tab's body runs
+tab1, tab2, tab3, tab4 = st.tabs([t["tab_daily"], t["tab_history"], t["tab_sim"], t["tab_zones"]], key="view_tab", on_change="rerun")
+
+# === TAB 1: DAILY VIEW ===
+if tab1.open:
+    with tab1:
+        snapshot = get_snapshot(day_select, country_choice, lang_choice) if default_view and day_select == date.today() else None
+        estimated = day_select > max_allowed
+        if snapshot is not None:
+            df, current_tz, slot_minutes = snapshot_frame(snapshot)
+        elif estimated:
+            # Not published yet: the forecast goes through the same tariff, chart and calculator paths
+            df, current_tz, slot_minutes = get_daily_prices(get_forecast_window(day_select, country_choice), day_select, country_choice)
+        else:
+            price_window = get_price_window(day_select, country_choice, days=0)
+            df, current_tz, slot_minutes = get_daily_prices(price_window, day_select, country_choice, 15 if quarter_hour else 60)
+
+        if df is not None and not df.empty:
+            # --- CALCULATION LOGIC ---
+            if show_raw:
+                df['Display_Price'] = df['Raw_Price_MWh']
+                unit_label = "€/MWh"
+                fmt_str = "{:.2f} €" 
+                title_label = "MWh"
+            else:
+                unit_label = "€/kWh"
+                fmt_str = "{:.3f} €" 
+                title_label = "PVPC"
+            
+                # A snapshot already carries the default tariff's columns
+                if snapshot is None:
+                    is_weekend = day_select.weekday() >= 5
+                    periods = period_index(df['Hour_Int'].to_numpy(), is_weekend)
+                    with metrics.span("tariff"):
+                        df['Grid_Fee_Applied'] = tariff.grid_fees[periods]
+                        df['Display_Price'] = final_prices(df['Raw_Price_MWh'].to_numpy(), periods, tariff)
+            if estimated:
+                title_label = f"{title_label} {t['forecast_short']}"
+                st.warning(t["forecast_flag"])
+
+            # --- LIVE STATUS ---
+            if day_select == date.today():
+                now_local = datetime.now(pytz.timezone(current_tz))
+                curr_row = df.loc[df['Hour_Start'] == slot_label(now_local, slot_minutes)]
+                if not curr_row.empty:
+                    cp = curr_row['Display_Price'].values[0]
+                    avg = df['Display_Price'].mean()
+                
+                    if not show_raw and show_fixed:
+                        if cp < fixed_price_final:
+                            v_txt, v_col = t["verdict_fixed_win"], "green"
+                            delta_val = cp - fixed_price_final
+                        else:
+                            v_txt, v_col = t["verdict_fixed_loss"], "red"
+                            delta_val = cp - fixed_price_final
+                        delta_text = f"{delta_val:.2f} vs Fixed"
+                    else:
+                        if cp < avg * 0.9: v_txt, v_col = t["verdict_good"], "green"
+                        elif cp > avg * 1.1: v_txt, v_col = t["verdict_bad"], "red"
+                        else: v_txt, v_col = t["verdict_avg"], "orange"
+                        delta_text = f"{cp - avg:.2f} vs Avg"
+
+                    st.markdown(f"### {t['now_label']} ({now_local.strftime('%H:%M')})")
+                    c1, c2 = st.columns([1, 2])
+                    c1.metric(t['price_axis'], fmt_str.format(cp), delta=delta_text, delta_color="inverse")
+                    c2.markdown(f"#### :{v_col}[{v_txt}]")
+                    st.divider()
+
+            avg_price = df['Display_Price'].mean()
+            min_price = df['Display_Price'].min()
+            max_price = df['Display_Price'].max()
+            best_h_idx = df['Display_Price'].idxmin()
+            best_h_range = df.loc[best_h_idx, 'Hour_Range']
+
+            st.markdown(f"### 📊 {t['daily_summary']} ({unit_label})")
+            m1, m2, m3 = st.columns(3)
+            m1.metric(t["avg_price"], fmt_str.format(avg_price))
+            m2.metric(t["min_price"], fmt_str.format(min_price), f"at {best_h_range}", delta_color="inverse")
+            m3.metric(t["max_price"], fmt_str.format(max_price), delta_color="normal")
+
+            # --- FORMULA EXPLAINER (Mobile Friendly Vertical List) ---
+            if not show_raw:
+                with st.expander(t["explain_title"]):
+                    avg_mkt = df['Raw_Price_MWh'].mean() / 1000
+                    avg_grid = df['Grid_Fee_Applied'].mean()
+                
+                    # Steps logic calculation
+                    val_market = avg_mkt
+                    val_losses = avg_mkt * losses_val
+                    val_base = val_market + val_losses
+                    val_fees = comm_input + avg_grid
+                    val_subtotal = val_base + val_fees
+                    val_final = val_subtotal * (1 + tax_value)
+
+                    st.markdown(f"""
+                    **{t['step_market']}:** {val_market:.3f} €
+                    ⬇
+                    **{t['step_losses']} (+{losses_input}%):** {val_losses:.3f} €
+                    ⬇
+                    **{t['step_comm']}:** {val_fees:.3f} €
+                    ⬇
+                    **{t['step_tax']} (+{int(tax_value*100)}%):**
+                    ⬇
+                    **{t['step_final']}:** :green[{val_final:.3f} €/kWh]
+                    """)
+
+            st.markdown("---")
+        
+            render_daily_chart(df, day_select, current_tz, t, show_raw, not show_raw and show_fixed, fixed_price_final, unit_label, title_label, slot_minutes)
+
+            if show_calculator and not show_raw:
+                render_calculator(df, day_select, country_choice, tariff, t, fmt_str, slot_minutes, show_forecast)
+
+            st.markdown(f"### {t['table_title']}")
+            render_data_table(df, t, show_raw, unit_label)
+            render_export(day_select, None if show_raw else tariff, quarter_hour, t)
+        else:
+            st.error(f"{t['data_unavailable']} {day_select}.")
+
+# === TAB 2: HISTORY VIEW ===
+if tab2.open:
+    with tab2:
+        render_history(day_select, country_choice, None if show_raw else tariff, t)
+
+# === TAB 3: COST SIMULATOR ===
+if tab3.open:
+    with tab3:
+        if show_raw: st.info(t["sim_raw_info"])
+        else: render_simulator(country_choice, tariff, fixed_val_input if show_fixed else default_fixed_val, t)
+
+# === TAB 4: ZONE COMPARISON ===
+if tab4.open:
+    with tab4:
+        render_zones(day_select, country_choice, quarter_hour, t)
+
+# --- ⏱️ RERUN SUMMARY ---
+metrics.observe("omie_stage_seconds", time.perf_counter() - rerun_started, stage="rerun")
+trace = metrics.end_trace(zone=country_choice, date=str(day_select))
+if profiler is not None:
+    import pstats
+    profiler.disable()
+    report = io.StringIO()
+    pstats.Stats(profiler, stream=report).sort_stats("cumulative").print_stats(30)
+    with st.expander("⏱️ Profile", expanded=True):
+        st.json({k: round(v * 1000, 2) for k, v in (trace or {}).items()})
+        st.code(report.getvalue())
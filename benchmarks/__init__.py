@@ -0,0 +1,8 @@
+# Offline performance benchmarks over recorded energy-charts /price fixtures.
+#
+#   python -m benchmarks.run                  time every stage, compare to benchmarks/baseline.json
+#   python -m benchmarks.run --save-baseline  store the current timings as the baseline
+#   python -m benchmarks.fixtures --record    refresh the fixtures from the live API
+#   python -m benchmarks.mock_api             serve a local /price stand-in (set OMIE_API_URL to its url)
+#   python -m benchmarks.load_test            many concurrent sessions against `streamlit run app.py`
+#   python -m benchmarks.alerts               time 100k price-alert rules end to end, webhook included
@@ -0,0 +1,116 @@
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+from datetime import timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+
+from benchmarks.fixtures import synthesize
+from omie.alerts import evaluate, rules_from_dicts, webhook_sink
+from omie.series import slot_means
+from omie.store import MIBEL_ZONES, market_today
+
+
+class WebhookReceiver:
+    """Local stand-in for an alert webhook: accepts POSTed notification batches and counts them."""
+
+    def __init__(self, port=0):
+        self.lock = threading.Lock()
+        self.stats = {"posts": 0, "notifications": 0}
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/hook"
+
+    def _handler(self):
+        receiver = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_POST(self):
+                body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+                with receiver.lock:
+                    receiver.stats["posts"] += 1
+                    receiver.stats["notifications"] += len(body.get("notifications", []))
+                self.send_response(204)
+                self.end_headers()
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self):
+        threading.Thread(target=self.server.serve_forever, name="webhook-receiver", daemon=True).start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def random_rules(n, configs, seed=0):
+    # n rules spread over `configs` distinct tariffs, 80% "below" and 20% "window"
+    rng = random.Random(seed)
+    tariffs = [{"vat": rng.choice([0.21, 0.23]), "comm_fee": round(rng.uniform(0.005, 0.03), 3),
+                "losses": rng.choice([0.14, 0.1674]), "grid_p1": round(rng.uniform(0.04, 0.09), 3),
+                "grid_p2": round(rng.uniform(0.03, 0.06), 3), "grid_p3": round(rng.uniform(0.01, 0.04), 3)}
+               for _ in range(configs)]
+    rules = []
+    for i in range(n):
+        rule = dict(tariffs[rng.randrange(configs)], id=f"r{i}", target=f"user{i}", zone=rng.choice(MIBEL_ZONES))
+        if rng.random() < 0.8: rule.update(kind="below", threshold=round(rng.uniform(0.08, 0.25), 3))
+        else: rule.update(kind="window", hours=rng.choice([1, 2, 3, 4]))
+        rules.append(rule)
+    return rules
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Time the alert engine on synthetic rules and prices.")
+    parser.add_argument("--rules", type=int, default=100_000)
+    parser.add_argument("--configs", type=int, default=500, help="distinct tariff configs among the rules")
+    parser.add_argument("--resolution", choices=("1h", "15min"), default="1h")
+    parser.add_argument("--serve", type=int, default=None, metavar="PORT", help="only run the webhook stand-in")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    if args.serve is not None:
+        receiver = WebhookReceiver(args.serve)
+        print(f"Receiving on {receiver.url}")
+        try:
+            receiver.server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        return 0
+
+    seconds = 900 if args.resolution == "15min" else 3600
+    day = market_today() + timedelta(days=1)
+    started = time.perf_counter()
+    rules = rules_from_dicts(random_rules(args.rules, args.configs, args.seed))
+    loaded = time.perf_counter()
+    notifications = []
+    for bzn in MIBEL_ZONES:
+        payload = synthesize(bzn, day, day)
+        slots, raw = slot_means(np.array(payload["unix_seconds"]), np.array(payload["price"]), seconds)
+        notifications += evaluate(rules, day, slots, raw, bzn, seconds)
+    evaluated = time.perf_counter()
+    receiver = WebhookReceiver().start()
+    try:
+        webhook_sink(receiver.url)(notifications)
+    finally:
+        receiver.stop()
+    sent = time.perf_counter()
+
+    print(f"{len(rules)} rules over {args.configs} tariff configs, {len(notifications)} notifications")
+    print(f"load {loaded - started:7.3f} s   evaluate {evaluated - loaded:7.3f} s   "
+          f"webhook {sent - evaluated:7.3f} s ({receiver.stats['posts']} posts)")
+    return 0 if receiver.stats["notifications"] == len(notifications) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,97 @@
+import json
+import math
+import os
+import random
+from datetime import date
+
+from omie.store import day_bounds
+
+FIXTURE_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+# Recorded /price responses (bzn, start, end). Multi-year ranges are too large
+# to keep in git and are synthesized on demand in the same shape.
+RANGES = {
+    "1d": (date(2025, 6, 2), date(2025, 6, 2)),
+    "30d": (date(2025, 5, 3), date(2025, 6, 2)),
+    "3y": (date(2022, 6, 3), date(2025, 6, 2)),
+}
+RECORDED = ("1d", "30d")
+STEP = 900      # energy-charts publishes quarter-hour Iberian prices
+
+
+def fixture_path(bzn, range_name):
+    return os.path.join(FIXTURE_DIR, f"price_{bzn}_{range_name}.json")
+
+
+def synthesize(bzn, start, end, seed=0, step=STEP):
+    # Deterministic /price payload with a solar dip, an evening peak and noise
+    rng = random.Random(f"{bzn}-{start}-{end}-{seed}")
+    lo, hi = day_bounds(start, end)
+    unix_seconds = list(range(lo, hi, step))
+    prices = []
+    for ts in unix_seconds:
+        hour = (ts % 86400) / 3600 + 1
+        day_level = 70 + 30 * math.sin(ts / 86400 / 58)
+        solar = -45 * max(0.0, math.sin((hour - 7) / 12 * math.pi))
+        evening = 35 * math.exp(-((hour - 21) ** 2) / 4)
+        prices.append(round(max(-5.0, day_level + solar + evening + rng.gauss(0, 6)) + (2 if bzn == "ES" else 0), 2))
+    return {
+        "license_info": "CC BY 4.0 (synthetic benchmark fixture)",
+        "unix_seconds": unix_seconds,
+        "price": prices,
+        "unit": "EUR / MWh",
+        "deprecated": False,
+    }
+
+
+def load_payload(bzn, range_name):
+    path = fixture_path(bzn, range_name)
+    if os.path.exists(path):
+        with open(path) as f:
+            return json.load(f)
+    start, end = RANGES[range_name]
+    return synthesize(bzn, start, end)
+
+
+def fixture_fetcher(payloads, shift_days=0):
+    """A PriceStore fetcher serving recorded payloads, optionally moved shift_days later.
+
+    payloads maps bzn to a /price response.
+    """
+    shift = shift_days * 86400
+
+    def fetch(bzn, start, end):
+        lo, hi = day_bounds(start, end)
+        data = payloads[bzn]
+        points = [(ts + shift, p) for ts, p in zip(data["unix_seconds"], data["price"]) if lo <= ts + shift < hi]
+        return [ts for ts, _ in points], [p for _, p in points]
+
+    return fetch
+
+
+def record(bzn, range_name):
+    # Replaces a fixture with the live API response for the same range.
+    from omie.energy_charts import API_URL, get_session
+
+    start, end = RANGES[range_name]
+    response = get_session().get(f"{API_URL}?bzn={bzn}&start={start}&end={end}", timeout=(3.05, 60))
+    response.raise_for_status()
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    with open(fixture_path(bzn, range_name), "w") as f:
+        json.dump(response.json(), f)
+
+
+if __name__ == "__main__":
+    # python -m benchmarks.fixtures [--record]: writes the checked-in fixtures
+    import sys
+
+    for bzn in ("ES", "PT"):
+        for name in RECORDED:
+            if "--record" in sys.argv:
+                record(bzn, name)
+            else:
+                start, end = RANGES[name]
+                os.makedirs(FIXTURE_DIR, exist_ok=True)
+                with open(fixture_path(bzn, name), "w") as f:
+                    json.dump(synthesize(bzn, start, end), f)
+            print("wrote", fixture_path(bzn, name))
@@ -0,0 +1,236 @@
+import argparse
+import asyncio
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+import urllib.request
+from datetime import timedelta
+
+import numpy as np
+from streamlit.proto.BackMsg_pb2 import BackMsg
+from streamlit.proto.ForwardMsg_pb2 import ForwardMsg
+from websockets.asyncio.client import connect
+
+from benchmarks.mock_api import MockEnergyCharts
+from omie.store import market_today
+
+# Drives many concurrent browser-like sessions against real `streamlit run`
+# replicas over the websocket protocol, with the upstream API replaced by
+# benchmarks.mock_api. Hit ratios come from each replica's own /metrics.
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+SAMPLE = re.compile(r'^(\w+)(?:\{(.*)\})? (\S+)$')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_replica(port, env):
+    cmd = [sys.executable, "-m", "streamlit", "run", APP_PATH, "--server.port", str(port),
+           "--server.headless", "true", "--browser.gatherUsageStats", "false"]
+    return subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+
+
+def scrape_counters(ports, names):
+    # {(name, labels): value} of the given counters, summed over the replicas' /metrics
+    totals = {}
+    for port in ports:
+        with urllib.request.urlopen(f"http://127.0.0.1:{port}/metrics", timeout=5) as resp:
+            for line in resp.read().decode().splitlines():
+                match = SAMPLE.match(line)
+                if not match or match[1] not in names: continue
+                labels = tuple(sorted(re.findall(r'(\w+)="([^"]*)"', match[2] or "")))
+                totals[(match[1], labels)] = totals.get((match[1], labels), 0) + float(match[3])
+    return totals
+
+
+def wait_healthy(port, timeout=60):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        try:
+            with urllib.request.urlopen(f"http://127.0.0.1:{port}/_stcore/health", timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Streamlit on port {port} did not become healthy")
+
+
+class Session:
+    """One browser tab: a websocket plus the widget ids learned from its first run."""
+
+    def __init__(self, port, query_string):
+        self.url = f"ws://127.0.0.1:{port}/_stcore/stream"
+        self.query_string = query_string
+        self.widgets = {}       # name -> widget id
+        self.zones = []         # country radio options
+        self.errors = 0         # exceptions rendered by the app
+        self.tabs = None        # (tab container id, [tab labels])
+        self.ws = None
+
+    async def open(self):
+        self.ws = await connect(self.url, subprotocols=["streamlit"], max_size=None)
+
+    async def close(self):
+        await self.ws.close()
+
+    async def rerun(self, day=None, zone_idx=None, tab_idx=None):
+        msg = BackMsg()
+        msg.rerun_script.query_string = self.query_string
+        states = msg.rerun_script.widget_states.widgets
+        if day is not None and "date" in self.widgets:
+            state = states.add()
+            state.id = self.widgets["date"]
+            state.string_array_value.data.append(day.strftime("%Y/%m/%d"))
+        if zone_idx is not None and "zone" in self.widgets:
+            state = states.add()
+            state.id = self.widgets["zone"]
+            state.string_value = self.zones[zone_idx]
+        if tab_idx is not None and self.tabs:
+            state = states.add()
+            state.id = self.tabs[0]
+            state.string_value = self.tabs[1][tab_idx]
+
+        started = time.perf_counter()
+        await self.ws.send(msg.SerializeToString())
+        tab_labels = []
+        while True:
+            fwd = ForwardMsg()
+            fwd.ParseFromString(await self.ws.recv())
+            kind = fwd.WhichOneof("type")
+            if kind == "delta":
+                self._learn(fwd.delta, tab_labels)
+            elif kind == "script_finished":
+                return time.perf_counter() - started
+
+    def _learn(self, delta, tab_labels):
+        kind = delta.WhichOneof("type")
+        if kind == "new_element":
+            element = delta.new_element
+            name = element.WhichOneof("type")
+            if name == "date_input": self.widgets["date"] = element.date_input.id
+            elif name == "radio" and element.radio.horizontal and len(element.radio.options) == 2 \
+                    and "(ES)" in element.radio.options[0]:
+                self.widgets["zone"] = element.radio.id
+                self.zones = list(element.radio.options)
+            elif name == "exception":
+                self.errors += 1
+                if self.errors == 1: print("app exception:", element.exception.message, file=sys.stderr)
+        elif kind == "add_block":
+            block = delta.add_block
+            name = block.WhichOneof("type")
+            if name == "tab_container": self.tabs = (block.tab_container.id, tab_labels)
+            elif name == "tab": tab_labels.append(block.tab.label)
+
+
+def random_query(rng):
+    params = {"lang_idx": rng.randrange(3), "vat": rng.choice([21, 23]), "comm_fee": rng.choice([0.01, 0.025]),
+              "losses": rng.choice([14.0, 16.74]), "grid_type": rng.choice(["Fixed", "Variable"])}
+    return "&".join(f"{k}={v}" for k, v in params.items())
+
+
+async def run_session(port, rng, reruns, days_back, history_share, latencies):
+    session = Session(port, random_query(rng))
+    await session.open()
+    try:
+        latencies.append(await session.rerun())
+        today = market_today()
+        for _ in range(reruns - 1):
+            day = today - timedelta(days=rng.randrange(days_back))
+            history = rng.random() < history_share
+            latencies.append(await session.rerun(day, rng.randrange(2), 1 if history else 0))
+    finally:
+        await session.close()
+    return session.errors
+
+
+async def drive(ports, args):
+    rng = random.Random(args.seed)
+    latencies = []
+    tasks = []
+    for i in range(args.sessions):
+        session_rng = random.Random(rng.random())
+        tasks.append(run_session(ports[i % len(ports)], session_rng, args.reruns, args.days_back,
+                                 args.history_share, latencies))
+        if args.ramp: await asyncio.sleep(args.ramp / args.sessions)
+    results = await asyncio.gather(*tasks, return_exceptions=True)
+    failures = [r for r in results if isinstance(r, Exception)]
+    app_errors = sum(r for r in results if isinstance(r, int))
+    return latencies, failures, app_errors
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Multi-session load test of app.py against a local API stand-in.")
+    parser.add_argument("--sessions", type=int, default=50)
+    parser.add_argument("--reruns", type=int, default=5, help="reruns per session, including the first page load")
+    parser.add_argument("--replicas", type=int, default=1, help="streamlit processes sharing one price store")
+    parser.add_argument("--days-back", type=int, default=60, help="dates are picked from the last N days")
+    parser.add_argument("--history-share", type=float, default=0.2, help="share of reruns on the history tab")
+    parser.add_argument("--ramp", type=float, default=0.0, help="seconds over which sessions are started")
+    parser.add_argument("--latency", type=float, default=0.2, help="mock upstream latency in seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0)
+    parser.add_argument("--resolution", choices=("15min", "1h"), default="15min")
+    parser.add_argument("--prefetch", action="store_true", help="let each replica run its prefetch thread")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    mock = MockEnergyCharts(latency=args.latency, jitter=args.latency / 2, error_rate=args.error_rate,
+                            step=900 if args.resolution == "15min" else 3600).start()
+    replicas = []
+    with tempfile.TemporaryDirectory() as tmp:
+        env = dict(os.environ, OMIE_API_URL=mock.url, OMIE_STORE_PATH=os.path.join(tmp, "prices.sqlite"),
+                   OMIE_PREFETCH="1" if args.prefetch else "0", OMIE_SNAPSHOT_DIR=os.path.join(tmp, "snapshots"))
+        try:
+            ports = [free_port() for _ in range(args.replicas)]
+            metrics_ports = [free_port() for _ in range(args.replicas)]
+            replicas = [start_replica(port, dict(env, OMIE_METRICS_PORT=str(mport))) for port, mport in zip(ports, metrics_ports)]
+            for port in ports:
+                wait_healthy(port)
+            started = time.perf_counter()
+            latencies, failures, app_errors = asyncio.run(drive(ports, args))
+            elapsed = time.perf_counter() - started
+            counters = scrape_counters(metrics_ports, {"omie_store_days_total", "omie_cache_requests_total",
+                                                       "omie_cache_misses_total", "omie_snapshot_requests_total"})
+        finally:
+            for proc in replicas:
+                proc.terminate()
+            for proc in replicas:
+                proc.wait(timeout=30)
+            mock.stop()
+
+    stats = mock.stats
+    ms = np.array(latencies) * 1000
+    print(f"{args.sessions} sessions x {args.reruns} reruns on {args.replicas} replica(s) in {elapsed:.1f} s")
+    if len(ms):
+        print(f"rerun latency  p50 {np.percentile(ms, 50):8.1f} ms   p99 {np.percentile(ms, 99):8.1f} ms"
+              f"   max {ms.max():8.1f} ms   ({len(ms)} reruns)")
+    print(f"upstream calls {stats['calls']} ({stats['errors']} errors), {stats['days']} days fetched")
+    # Hit ratios as the replicas counted them: store days, then each Streamlit cache and the snapshots
+    hits, misses = (counters.get(("omie_store_days_total", (("result", r),)), 0) for r in ("hit", "miss"))
+    if hits + misses:
+        print(f"store hit ratio {hits / (hits + misses):.1%} of {hits + misses:.0f} days asked")
+    for (name, labels), lookups in sorted(counters.items()):
+        if name != "omie_cache_requests_total" or not lookups: continue
+        missed = counters.get(("omie_cache_misses_total", labels), 0)
+        print(f"cache {dict(labels)['cache']:<12} hit ratio {1 - missed / lookups:.1%} of {lookups:.0f} lookups")
+    hits, misses = (counters.get(("omie_snapshot_requests_total", (("result", r),)), 0) for r in ("hit", "miss"))
+    if hits + misses:
+        print(f"snapshot     hit ratio {hits / (hits + misses):.1%} of {hits + misses:.0f} lookups")
+    if app_errors:
+        print(f"{app_errors} exception(s) rendered by the app")
+    if failures:
+        print(f"{len(failures)} session(s) failed, first: {failures[0]!r}")
+    if failures or app_errors:
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,114 @@
+import argparse
+import json
+import random
+import threading
+import time
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from benchmarks.fixtures import STEP, synthesize
+from omie.store import market_today
+
+
+class MockEnergyCharts:
+    """Local stand-in for the energy-charts /price endpoint.
+
+    Serves synthetic payloads with configurable latency, error rate and
+    resolution. Days after market tomorrow come back empty, like unpublished
+    prices. GET /stats returns the call counters.
+    """
+
+    def __init__(self, port=0, latency=0.0, jitter=0.0, error_rate=0.0, step=STEP, seed=0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+        self.step = step
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {"calls": 0, "days": 0, "errors": 0}
+        self.server = ThreadingHTTPServer(("127.0.0.1", port), self._handler())
+        self.server.daemon_threads = True
+        self.thread = None
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.server.server_port}/price"
+
+    def _handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                parsed = urlparse(self.path)
+                if parsed.path == "/stats":
+                    with mock.lock:
+                        return self._send(200, dict(mock.stats))
+                if parsed.path != "/price":
+                    return self._send(404, {"detail": "Not Found"})
+                return self._send(*mock.price(parse_qs(parsed.query)))
+
+            def _send(self, status, payload):
+                body = json.dumps(payload).encode()
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def price(self, query):
+        try:
+            bzn = query["bzn"][0]
+            start, end = date.fromisoformat(query["start"][0]), date.fromisoformat(query["end"][0])
+        except (KeyError, ValueError):
+            return 422, {"detail": "bzn, start and end are required"}
+        with self.lock:
+            self.stats["calls"] += 1
+            self.stats["days"] += (end - start).days + 1
+            failed = self.rng.random() < self.error_rate
+            delay = self.latency + self.rng.uniform(0, self.jitter)
+            if failed: self.stats["errors"] += 1
+        time.sleep(delay)
+        if failed: return 503, {"detail": "Service Unavailable"}
+        end = min(end, market_today() + timedelta(days=1))
+        if end < start: return 200, {"unix_seconds": [], "price": [], "unit": "EUR / MWh", "deprecated": False}
+        return 200, synthesize(bzn, start, end, step=self.step)
+
+    def reset_stats(self):
+        with self.lock:
+            self.stats = {"calls": 0, "days": 0, "errors": 0}
+
+    def start(self):
+        self.thread = threading.Thread(target=self.server.serve_forever, name="mock-energy-charts", daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.server.shutdown()
+        self.server.server_close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Local stand-in for api.energy-charts.info/price.")
+    parser.add_argument("--port", type=int, default=8090)
+    parser.add_argument("--latency", type=float, default=0.0, help="seconds added to every response")
+    parser.add_argument("--jitter", type=float, default=0.0, help="extra random latency up to this many seconds")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="share of requests answered with 503")
+    parser.add_argument("--resolution", choices=("15min", "1h"), default="15min")
+    args = parser.parse_args(argv)
+    mock = MockEnergyCharts(args.port, args.latency, args.jitter, args.error_rate,
+                            step=900 if args.resolution == "15min" else 3600)
+    print(f"Serving on {mock.url}  (export OMIE_API_URL={mock.url})")
+    try:
+        mock.server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+import argparse
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import pandas as pd
+
+from benchmarks.fixtures import RANGES, fixture_fetcher, load_payload
+from omie.figures import daily_figure, daily_layout
+from omie.frames import add_hour_labels, daily_average, hourly_frame
+from omie.scheduler import Load, schedule
+from omie.store import MIBEL_ZONES, ZONE_TZ, PriceStore, market_today
+from omie.tariff import TariffConfig, final_prices, period_index
+
+APP_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "app.py")
+BASELINE_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), "baseline.json")
+TOLERANCE = 0.25        # relative slowdown reported as a regression
+MIN_DELTA = 0.0005      # ignore differences below half a millisecond
+
+TARIFF = TariffConfig(grid_p1=0.100, grid_p2=0.040, grid_p3=0.010)
+
+
+def measure(fn, repeat):
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return statistics.median(times)
+
+
+def stage_timings(bzn, range_name, repeat):
+    # Median seconds per pipeline stage for one zone and fixture range.
+    tz = ZONE_TZ[bzn]
+    payload = load_payload(bzn, range_name)
+    raw_json = json.dumps(payload)
+    start, end = RANGES[range_name]
+    results = {}
+
+    def parse():
+        data = json.loads(raw_json)
+        return pd.DataFrame({
+            'Timestamp': pd.to_datetime(data['unix_seconds'], unit='s', utc=True),
+            'Raw_Price_MWh': data['price'],
+        })
+
+    results["parse"] = measure(parse, repeat)
+    points = parse()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        def store_write():
+            store = PriceStore(os.path.join(tmp, f"{time.perf_counter_ns()}.sqlite"),
+                               fetcher=fixture_fetcher({bzn: payload}))
+            store.backfill(bzn, start, end)
+        results["store_write"] = measure(store_write, repeat)
+        store = PriceStore(os.path.join(tmp, "read.sqlite"), fetcher=fixture_fetcher({bzn: payload}))
+        store.backfill(bzn, start, end)
+        results["store_load"] = measure(lambda: store.load(bzn, start, end), repeat)
+        if range_name != "1d":
+            results["rollups"] = measure(lambda: store.load_rollups(bzn, "D", start, end), repeat)
+
+    results["resample"] = measure(lambda: hourly_frame(points, tz), repeat)
+    hourly = hourly_frame(points, tz).reset_index()
+    results["labels"] = measure(lambda: add_hour_labels(hourly.copy()), repeat)
+    labelled = add_hour_labels(hourly.copy())
+
+    local = pd.DatetimeIndex(labelled['Timestamp'])
+    raw = labelled['Raw_Price_MWh'].to_numpy()
+    results["tariff"] = measure(
+        lambda: final_prices(raw, period_index(local.hour, local.dayofweek >= 5), TARIFF), repeat)
+    if range_name != "1d":
+        results["history"] = measure(lambda: daily_average(points, tz, TARIFF), repeat)
+
+    prices = final_prices(raw, period_index(local.hour, local.dayofweek >= 5), TARIFF)
+    results["calculator"] = measure(lambda: schedule(prices, [Load("run", 7400, 4.5)]), repeat)
+
+    # The daily chart always shows one day: the last 24 hours of the range
+    day = labelled.tail(24)
+    layout = daily_layout(False, False, "Hora Início", ("Ponta", "Cheias", "Vazio"))
+
+    def figure():
+        return daily_figure(layout, day['Hour_Start'].tolist(), prices[-24:].tolist(),
+                            list(zip(day['Hour_Range'], day['Raw_Price_MWh'].tolist())),
+                            "PVPC", "%{y}", now_x="12:00")
+
+    results["figure"] = measure(figure, repeat)
+    try:
+        import plotly.graph_objects as go
+        import plotly.io
+        spec = figure()
+        results["figure_json"] = measure(lambda: plotly.io.to_json(go.Figure(spec), validate=False), repeat)
+    except ImportError:
+        pass
+    return results
+
+
+def rerun_timings(repeat):
+    # End-to-end reruns through Streamlit's AppTest against a store seeded from the 30-day fixtures.
+    try:
+        from streamlit.testing.v1 import AppTest
+    except ImportError:
+        return {}
+    _, end = RANGES["30d"]
+    shift = (market_today() - end).days
+    payloads = {bzn: load_payload(bzn, "30d") for bzn in MIBEL_ZONES}
+    results = {}
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "app.sqlite")
+        start, _ = RANGES["30d"]
+        seeder = PriceStore(path, fetcher=fixture_fetcher(payloads, shift))
+        for bzn in MIBEL_ZONES:
+            seeder.backfill(bzn, start + pd.Timedelta(days=shift), market_today())
+        os.environ["OMIE_STORE_PATH"] = path
+        os.environ["OMIE_PREFETCH"] = "0"
+        os.environ["OMIE_SNAPSHOT_DIR"] = os.path.join(tmp, "snapshots")
+        at = AppTest.from_file(APP_PATH, default_timeout=120).run()
+        results["rerun_daily"] = measure(at.run, repeat)
+        at.session_state["view_tab"] = at.tabs[1].label
+        at.run()
+        results["rerun_history"] = measure(at.run, repeat)
+        check_settings(AppTest)
+    return results
+
+
+def check_settings(AppTest):
+    # Non-default settings skip the snapshot and take every branch of the daily tab; any exception fails the run
+    def check(at, name):
+        if at.exception: raise RuntimeError(f"app exception with {name}: {at.exception[0].message}")
+        return at
+
+    at = AppTest.from_file(APP_PATH, default_timeout=120)
+    for key, value in {"vat": "21", "grid_type": "Variable", "quarter_hour": "true", "show_fixed_comp": "true"}.items():
+        at.query_params[key] = value
+    check(at.run(), "non-default settings")
+    # Before publication tomorrow can be picked with forecast prices: with the tariff, the export open and in raw mode
+    picker = at.date_input[0]
+    if picker.max > market_today():
+        check(picker.set_value(picker.max).run(), "forecast day")
+        at.session_state["export_open"] = True
+        check(at.run(), "forecast day, export")
+        check(at.toggle[0].set_value(True).run(), "forecast day, raw")
+    check(at.date_input[0].set_value(market_today()).run(), "raw")
+
+
+def compare(results, baseline):
+    regressions = []
+    for key, value in sorted(results.items()):
+        base = baseline.get(key)
+        note = ""
+        if base:
+            ratio = value / base
+            note = f"{ratio:6.2f}x"
+            if value > base * (1 + TOLERANCE) and value - base > MIN_DELTA:
+                regressions.append(key)
+                note += "  REGRESSION"
+        print(f"{key:28s} {value * 1000:10.3f} ms  {note}")
+    return regressions
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Offline benchmarks over recorded energy-charts fixtures.")
+    parser.add_argument("--zone", choices=MIBEL_ZONES, default="PT")
+    parser.add_argument("--ranges", nargs="+", choices=sorted(RANGES), default=list(RANGES))
+    parser.add_argument("--repeat", type=int, default=7)
+    parser.add_argument("--no-rerun", action="store_true", help="skip the Streamlit AppTest reruns")
+    parser.add_argument("--baseline", default=BASELINE_PATH)
+    parser.add_argument("--save-baseline", action="store_true", help="store these timings as the new baseline")
+    args = parser.parse_args(argv)
+
+    results = {}
+    for range_name in args.ranges:
+        for stage, seconds in stage_timings(args.zone, range_name, args.repeat).items():
+            results[f"{args.zone}/{range_name}/{stage}"] = seconds
+    if not args.no_rerun:
+        results.update(rerun_timings(max(3, args.repeat // 2)))
+
+    baseline = {}
+    if os.path.exists(args.baseline):
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+    regressions = compare(results, baseline)
+
+    if args.save_baseline:
+        with open(args.baseline, "w") as f:
+            json.dump(results, f, indent=1, sort_keys=True)
+        print("saved baseline to", args.baseline)
+        return 0
+    if regressions:
+        print(f"{len(regressions)} regression(s) against {args.baseline}")
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1 @@
+# Data layer for the Iberian electricity price app (fetching, storage, tariffs).
@@ -0,0 +1,5 @@
+import sys
+
+from omie.cli import main
+
+sys.exit(main())
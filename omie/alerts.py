@@ -0,0 +1,248 @@
+import argparse
+import json
+import logging
+import os
+import sys
+import threading
+from dataclasses import dataclass
+from datetime import date, datetime, timedelta
+
+import numpy as np
+import pytz
+
+from omie import metrics
+from omie.prefetch import next_run
+from omie.scheduler import window_costs
+from omie.series import local_times, slot_means
+from omie.store import MARKET_TZ, MIBEL_ZONES, ZONE_TZ, PriceStore, market_today
+from omie.tariff import TariffConfig, final_prices_batch, period_index
+
+log = logging.getLogger(__name__)
+
+# Subscriber price alerts, evaluated for a whole day at once when its prices
+# land. Rules are grouped by tariff config: each distinct config is priced
+# once, and its rules are answered with searchsorted over sorted thresholds.
+#
+#   python -m omie.alerts --rules rules.jsonl --webhook http://127.0.0.1:8091/hook
+
+KINDS = ("below", "window")     # final price under a threshold / start of the cheapest N-hour run
+TARIFF_FIELDS = ("vat", "comm_fee", "losses", "grid_p1", "grid_p2", "grid_p3")
+WEBHOOK_BATCH = 1000            # notifications per webhook POST
+
+
+@dataclass(frozen=True, eq=False)
+class Rules:
+    # Columnar rule table, one entry per rule in every array.
+    ids: np.ndarray             # str
+    targets: np.ndarray         # str, passed through to the sink
+    zones: np.ndarray           # str, bidding zone
+    kinds: np.ndarray           # index into KINDS
+    thresholds: np.ndarray      # €/kWh, for "below"
+    hours: np.ndarray           # run length, for "window"
+    tariffs: np.ndarray         # (N, 6) TariffConfig fields, in TARIFF_FIELDS order
+
+    def __len__(self):
+        return len(self.ids)
+
+
+def rules_from_dicts(items):
+    """Rules from dicts with id, target, zone, kind, threshold or hours, and the
+    TariffConfig fields (missing ones take the TariffConfig defaults)."""
+    items = list(items)
+    defaults = TariffConfig()
+    return Rules(
+        ids=np.array([str(r["id"]) for r in items], dtype=object),
+        targets=np.array([str(r.get("target", r["id"])) for r in items], dtype=object),
+        zones=np.array([r.get("zone", "PT") for r in items], dtype=object),
+        kinds=np.array([KINDS.index(r.get("kind", "below")) for r in items], dtype=np.intp),
+        thresholds=np.array([r["threshold"] if r.get("kind", "below") == "below" else np.nan for r in items], dtype=np.float64),
+        hours=np.array([r.get("hours", 1.0) for r in items], dtype=np.float64),
+        tariffs=np.array([[r.get(f, getattr(defaults, f)) for f in TARIFF_FIELDS] for r in items],
+                         dtype=np.float64).reshape(-1, len(TARIFF_FIELDS)),
+    )
+
+
+def load_rules(path):
+    # One JSON object per line
+    with open(path) as f:
+        return rules_from_dicts(json.loads(line) for line in f if line.strip())
+
+
+def _below(final, config_of, thresholds):
+    # First slot (-1 if none) and number of slots under each rule's threshold, per config row of final.
+    first = np.full(len(thresholds), -1, dtype=np.intp)
+    count = np.zeros(len(thresholds), dtype=np.intp)
+    order = np.lexsort((thresholds, config_of))
+    bounds = np.searchsorted(config_of[order], np.arange(len(final) + 1))
+    for c in range(len(final)):
+        sel = order[bounds[c]:bounds[c + 1]]
+        if not len(sel): continue
+        row = np.where(np.isnan(final[c]), np.inf, final[c])
+        thr = thresholds[sel]
+        count[sel] = np.searchsorted(np.sort(row), thr, side="left")
+        # The running minimum only falls, so the first slot under thr is one searchsorted away
+        falling = -np.minimum.accumulate(row)
+        hit = np.searchsorted(falling, -thr, side="right")
+        first[sel] = np.where(hit < len(row), hit, -1)
+    return first, count
+
+
+def evaluate(rules, day, slots, raw_mwh, bzn, seconds=3600):
+    """Notifications for the rules of zone bzn on one day's prices.
+
+    slots are UTC slot starts and raw_mwh their €/MWh. "below" rules fire when
+    some final price is under the threshold; "window" rules always fire with
+    the start of the cheapest run of `hours`.
+    """
+    mine = np.flatnonzero(rules.zones == bzn)
+    if not len(mine) or not len(slots): return []
+    local, hours, weekend = local_times(slots, ZONE_TZ[bzn])
+    configs, config_of = np.unique(rules.tariffs[mine], axis=0, return_inverse=True)
+    config_of = config_of.reshape(-1)
+    final = final_prices_batch(raw_mwh, period_index(hours, weekend), [TariffConfig(*row) for row in configs])
+
+    starts_iso = np.array([t.isoformat() for t in local], dtype=object)
+    out = []
+
+    def notify(idx, kind, starts, prices, **extra):
+        # Columns are gathered with fancy indexing; only the final dicts are built per rule
+        rows = mine[idx]
+        keys = ("rule", "target", "start", "price") + tuple(extra)
+        columns = [rules.ids[rows].tolist(), rules.targets[rows].tolist(), starts_iso[starts].tolist(),
+                   np.round(prices, 5).tolist()] + [np.asarray(v).tolist() for v in extra.values()]
+        common = {"zone": bzn, "day": day.isoformat(), "kind": kind}
+        out.extend(dict(common, **dict(zip(keys, values))) for values in zip(*columns))
+
+    below = np.flatnonzero(rules.kinds[mine] == KINDS.index("below"))
+    if len(below):
+        first, count = _below(final, config_of[below], rules.thresholds[mine][below])
+        fired = first >= 0
+        starts = first[fired]
+        notify(below[fired], "below", starts, final[config_of[below][fired], starts], slots=count[fired])
+
+    window = np.flatnonzero(rules.kinds[mine] == KINDS.index("window"))
+    lengths = rules.hours[mine][window]
+    for length in np.unique(lengths):
+        sel = window[lengths == length]
+        span = length * 3600 / seconds
+        costs = window_costs(final, span)           # (configs, slots): every config priced in one call
+        best = costs.argmin(axis=1)
+        ok = np.isfinite(costs[np.arange(len(final)), best])
+        rows = config_of[sel]
+        keep = ok[rows]
+        notify(sel[keep], "window", best[rows[keep]], costs[rows[keep], best[rows[keep]]] / span,
+               hours=np.full(keep.sum(), length))
+    metrics.inc("omie_alerts_total", len(out), zone=bzn)
+    return out
+
+
+def evaluate_day(store, rules, day, zones=None, seconds=3600):
+    # Evaluates every zone with rules whose prices for day are stored.
+    out = []
+    with metrics.span("alerts"):
+        for bzn in zones or sorted(set(rules.zones)):
+            if bzn not in MIBEL_ZONES: continue       # rules carry Iberian tariffs
+            slots, raw = slot_means(*store.load_arrays(bzn, day, day), seconds)
+            keep = ~np.isnan(raw)
+            out += evaluate(rules, day, slots[keep], raw[keep], bzn, seconds)
+    return out
+
+
+# --- SINKS ---
+# A sink is any callable taking a list of notification dicts.
+
+def jsonl_sink(out=None):
+    def send(notifications):
+        stream = out or sys.stdout
+        for note in notifications:
+            stream.write(json.dumps(note) + "\n")
+        stream.flush()
+    return send
+
+
+def webhook_sink(url, batch=WEBHOOK_BATCH):
+    # POSTs {"notifications": [...]} in batches over the shared keep-alive session
+    from omie.energy_charts import CONNECT_TIMEOUT, READ_TIMEOUT, get_session
+
+    def send(notifications):
+        for i in range(0, len(notifications), batch):
+            response = get_session().post(url, json={"notifications": notifications[i:i + batch]},
+                                          timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            response.raise_for_status()
+    return send
+
+
+class AlertWorker(threading.Thread):
+    """Daemon thread that evaluates the rules once per zone and day, as soon as
+    the next day's prices are stored (polling on the prefetcher's schedule)."""
+
+    def __init__(self, store, rules, sink, seconds=3600):
+        super().__init__(name="omie-alerts", daemon=True)
+        self.store = store
+        self.rules = rules
+        self.sink = sink
+        self.seconds = seconds
+        self.sent = set()       # (zone, day) already evaluated
+        self.stop_event = threading.Event()
+
+    def check(self):
+        # Returns True once tomorrow has been evaluated for every zone
+        tomorrow = market_today() + timedelta(days=1)
+        zones = sorted(set(self.rules.zones) & set(MIBEL_ZONES))
+        self.store.backfill_zones(zones, tomorrow, tomorrow)
+        stored = [bzn for bzn in zones if (bzn, tomorrow) not in self.sent
+                  and tomorrow in self.store.stored_days(bzn, tomorrow, tomorrow)]
+        if stored:
+            notifications = evaluate_day(self.store, self.rules, tomorrow, stored, self.seconds)
+            self.sink(notifications)
+            log.info("Sent %d alerts for %s %s", len(notifications), tomorrow, ",".join(stored))
+            self.sent.update((bzn, tomorrow) for bzn in stored)
+        return all((bzn, tomorrow) in self.sent for bzn in zones)
+
+    def run(self):
+        tz = pytz.timezone(MARKET_TZ)
+        while not self.stop_event.is_set():
+            try:
+                ready = self.check()
+            except Exception:
+                log.warning("Alert evaluation failed", exc_info=True)
+                ready = False
+            now = datetime.now(tz)
+            self.stop_event.wait((next_run(now, ready) - now).total_seconds())
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Evaluate subscriber price alerts when day-ahead prices land.")
+    parser.add_argument("--rules", required=True, help="JSON lines file, one rule per line")
+    parser.add_argument("--webhook", default=None, help="POST notifications here (default: JSON lines on stdout)")
+    parser.add_argument("--store", default=None, help="price store path (default $OMIE_STORE_PATH)")
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="evaluate this day once and exit")
+    parser.add_argument("--resolution", choices=("1h", "15min"), default="1h")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s", stream=sys.stderr)
+    if os.environ.get("OMIE_METRICS_PORT"): metrics.serve(int(os.environ["OMIE_METRICS_PORT"]))
+    store = PriceStore(args.store)
+    rules = load_rules(args.rules)
+    sink = webhook_sink(args.webhook) if args.webhook else jsonl_sink()
+    seconds = 900 if args.resolution == "15min" else 3600
+    if args.date:
+        store.backfill_zones(sorted(set(rules.zones) & set(MIBEL_ZONES)), args.date, args.date)
+        notifications = evaluate_day(store, rules, args.date, seconds=seconds)
+        sink(notifications)
+        log.info("Sent %d alerts for %s", len(notifications), args.date)
+        return 0
+    worker = AlertWorker(store, rules, sink, seconds)
+    worker.start()
+    try:
+        worker.join()
+    except KeyboardInterrupt:
+        worker.stop()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
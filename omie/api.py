@@ -0,0 +1,177 @@
+import argparse
+import hashlib
+import json
+import logging
+import math
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import date, timedelta
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+from omie import metrics
+from omie.export import price_rows
+from omie.store import MIBEL_ZONES, ZONE_TZ, PriceStore, market_today
+from omie.tariff import TariffConfig
+
+log = logging.getLogger(__name__)
+
+# Read-only JSON prices for integrations (Home Assistant, EV chargers):
+#
+#   GET /api/prices?zone=PT&date=2025-06-02[&end=...][&resolution=15min][&raw=1]
+#                   [&vat=23&comm_fee=0.025&losses=16.74&grid=0.06 or grid=P1,P2,P3]
+#
+# Rows are the export's (same slots and Core Formula as the app and CLI). Bodies are
+# cached in-process with an ETag; past days are immutable, so browsers and
+# proxies keep them for a year and pollers get 304s. The app serves it on
+# OMIE_API_PORT next to Streamlit; `python -m omie.api` runs it on its own.
+
+MAX_DAYS = 31
+CACHE_ENTRIES = 2048
+FRESH_TTL = 300         # seconds a response covering today or tomorrow is reused
+IMMUTABLE = "public, max-age=31536000, immutable"
+DEFAULTS = {"vat": "23", "comm_fee": "0.025", "losses": "16.74", "grid": "0.060"}
+
+
+class BadRequest(ValueError):
+    pass
+
+
+def parse_query(query):
+    # Normalized (zone, start, end, seconds, tariff or None) from a parsed query string
+    one = {k: v[-1] for k, v in query.items()}
+    zone = one.get("zone", "PT")
+    if zone not in ZONE_TZ: raise BadRequest(f"zone must be one of {', '.join(sorted(ZONE_TZ))}")
+    try:
+        start = date.fromisoformat(one["date"]) if "date" in one else market_today()
+        end = date.fromisoformat(one["end"]) if "end" in one else start
+        resolution = one.get("resolution", "1h")
+        if resolution not in ("1h", "15min"): raise ValueError("resolution must be 1h or 15min")
+        tariff = None
+        if one.get("raw") not in ("1", "true"):
+            params = {k: one.get(k, v) for k, v in DEFAULTS.items()}
+            vat, comm_fee, losses = (float(params[k]) for k in ("vat", "comm_fee", "losses"))
+            grid = [float(g) for g in params["grid"].split(",")]
+            if len(grid) not in (1, 3): raise ValueError("grid takes one fixed fee or P1,P2,P3")
+            if not all(math.isfinite(v) for v in (vat, comm_fee, losses, *grid)):
+                raise ValueError("vat, comm_fee, losses and grid must be finite numbers")
+            p1, p2, p3 = grid * 3 if len(grid) == 1 else grid
+            tariff = TariffConfig(vat=vat / 100, comm_fee=comm_fee, losses=losses / 100, grid_p1=p1, grid_p2=p2, grid_p3=p3)
+    except ValueError as e:
+        raise BadRequest(str(e))
+    if tariff is not None and zone not in MIBEL_ZONES:
+        raise BadRequest(f"the tariff only applies to {', '.join(MIBEL_ZONES)}; add raw=1 for other zones")
+    if end < start or (end - start).days >= MAX_DAYS: raise BadRequest(f"end must be within {MAX_DAYS} days after date")
+    return zone, start, end, 900 if resolution == "15min" else 3600, tariff
+
+
+class PriceAPI:
+    """Builds and caches /api/prices responses: key -> (etag, body, cache-control, expires_at)."""
+
+    def __init__(self, store, max_entries=CACHE_ENTRIES, fresh_ttl=FRESH_TTL):
+        self.store = store
+        self.max_entries = max_entries
+        self.fresh_ttl = fresh_ttl
+        self.cache = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, query):
+        # (status, body bytes, headers)
+        try:
+            key = parse_query(query)
+        except BadRequest as e:
+            return 400, json.dumps({"error": str(e)}).encode(), {"Cache-Control": "no-store"}
+        if key[1] > market_today() + timedelta(days=1):
+            return 404, json.dumps({"error": "no prices for this range yet"}).encode(), {"Cache-Control": "no-store"}
+        now = time.time()
+        with self.lock:
+            entry = self.cache.get(key)
+            if entry is not None and entry[3] > now:
+                self.cache.move_to_end(key)
+                metrics.inc("omie_cache_requests_total", cache="api")
+                return 200, entry[1], {"ETag": entry[0], "Cache-Control": entry[2]}
+        metrics.inc("omie_cache_requests_total", cache="api")
+        metrics.inc("omie_cache_misses_total", cache="api")
+        entry = self._build(*key)
+        if entry is None:
+            return 404, json.dumps({"error": "no prices for this range yet"}).encode(), {"Cache-Control": "no-store"}
+        with self.lock:
+            self.cache[key] = entry
+            self.cache.move_to_end(key)
+            while len(self.cache) > self.max_entries:
+                self.cache.popitem(last=False)
+        return 200, entry[1], {"ETag": entry[0], "Cache-Control": entry[2]}
+
+    def _build(self, zone, start, end, seconds, tariff):
+        with metrics.span("api"):
+            rows = price_rows(self.store, zone, start, end, tariff, seconds=seconds)
+        if not rows: return None
+        payload = {
+            "zone": zone, "start": start.isoformat(), "end": end.isoformat(), "resolution": "15min" if seconds == 900 else "1h",
+            "tariff": None if tariff is None else {k: getattr(tariff, k) for k in tariff.__dataclass_fields__},
+            "prices": rows,
+        }
+        body = json.dumps(payload, separators=(",", ":")).encode()
+        etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+        # Only ranges of final past days are immutable; today's and tomorrow's answers may still change
+        if end < market_today() and len(self.store.final_days(zone, start, end)) == (end - start).days + 1:
+            return etag, body, IMMUTABLE, float("inf")
+        return etag, body, f"public, max-age={self.fresh_ttl}", time.time() + self.fresh_ttl
+
+
+def serve(port, store=None, api=None):
+    """Serves the API on http://0.0.0.0:port/api/prices from a daemon thread."""
+    api = api or PriceAPI(store or PriceStore())
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            url = urlparse(self.path)
+            if url.path != "/api/prices":
+                return self._send(404, b'{"error":"not found"}', {"Cache-Control": "no-store"})
+            status, body, headers = api.get(parse_qs(url.query))
+            etag = headers.get("ETag")
+            if etag and etag in [t.strip() for t in self.headers.get("If-None-Match", "").split(",")]:
+                return self._send(304, b"", headers)
+            return self._send(status, body, headers)
+
+        def _send(self, status, body, headers):
+            metrics.inc("omie_api_requests_total", status=status)
+            self.send_response(status)
+            if status != 304:
+                self.send_header("Content-Type", "application/json")
+                self.send_header("Content-Length", str(len(body)))
+            self.send_header("Access-Control-Allow-Origin", "*")
+            for name, value in headers.items():
+                self.send_header(name, value)
+            self.end_headers()
+            if status != 304: self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="omie-api", daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Read-only JSON price API.")
+    parser.add_argument("--port", type=int, default=int(os.environ.get("OMIE_API_PORT", 8502)))
+    parser.add_argument("--store", default=None, help="price store path (default $OMIE_STORE_PATH)")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s", stream=sys.stderr)
+    server = serve(args.port, PriceStore(args.store))
+    log.info("Serving on http://0.0.0.0:%d/api/prices", args.port)
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        server.shutdown()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import argparse
+import json
+import sys
+from datetime import date
+
+from omie.export import chunk_rows, iter_chunks, write_csv, write_parquet
+from omie.store import DEFAULT_PATH, MIBEL_ZONES, ZONE_TZ, PriceStore, market_today
+from omie.tariff import TariffConfig
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(prog="omie-fetch", description="Iberian day-ahead prices with tariff applied.")
+    parser.add_argument("--zone", choices=sorted(ZONE_TZ), action="append", help="bidding zone (repeatable, default PT)")
+    parser.add_argument("--date", type=date.fromisoformat, default=None, help="first day, YYYY-MM-DD (default today)")
+    parser.add_argument("--end", type=date.fromisoformat, default=None, help="last day, inclusive (default --date)")
+    parser.add_argument("--format", choices=("json", "csv", "parquet"), default="json")
+    parser.add_argument("--output", "-o", default="-", help="output file (default stdout; required for parquet)")
+    parser.add_argument("--store", default=None, help=f"price store path (default $OMIE_STORE_PATH or {DEFAULT_PATH})")
+    parser.add_argument("--offline", action="store_true", help="only read stored prices, never fetch")
+    parser.add_argument("--resolution", choices=("1h", "15min"), default="1h", help="row per hour or per quarter-hour")
+    parser.add_argument("--raw", action="store_true", help="skip the tariff and only output market prices")
+    parser.add_argument("--vat", type=float, default=23.0, help="VAT in percent")
+    parser.add_argument("--comm-fee", type=float, default=0.025, help="commercial margin in €/kWh")
+    parser.add_argument("--losses", type=float, default=16.74, help="losses in percent")
+    parser.add_argument("--grid", type=float, nargs="+", default=[0.060], metavar="FEE",
+                        help="grid fee in €/kWh: one fixed value, or P1 P2 P3")
+    args = parser.parse_args(argv)
+    if len(args.grid) not in (1, 3): parser.error("--grid takes one fixed fee or three P1 P2 P3 fees")
+    if not args.raw and set(args.zone or []) - set(MIBEL_ZONES):
+        parser.error(f"the tariff only applies to {', '.join(MIBEL_ZONES)}; add --raw for other zones")
+    if args.format == "parquet" and args.output == "-": parser.error("parquet output needs --output")
+    return args
+
+
+def tariff_from_args(args):
+    p1, p2, p3 = args.grid * 3 if len(args.grid) == 1 else args.grid
+    return TariffConfig(vat=args.vat / 100, comm_fee=args.comm_fee, losses=args.losses / 100,
+                        grid_p1=p1, grid_p2=p2, grid_p3=p3)
+
+
+def write_export(chunks, fmt, output):
+    # json is built in memory; csv and parquet are written chunk by chunk. Returns the row count.
+    if fmt == "json":
+        rows = [row for chunk in chunks for row in chunk_rows(chunk)]
+        if not rows: return 0
+    if fmt == "parquet": return write_parquet(chunks, output)
+    out = sys.stdout if output == "-" else open(output, "w", newline="")
+    try:
+        if fmt == "csv": return write_csv(chunks, out)
+        json.dump(rows, out, indent=1)
+        out.write("\n")
+        return len(rows)
+    finally:
+        if out is not sys.stdout: out.close()
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    start = args.date or market_today()
+    end = args.end or start
+    if end < start: end, start = start, end
+    store = PriceStore(args.store)
+    tariff = None if args.raw else tariff_from_args(args)
+    seconds = 900 if args.resolution == "15min" else 3600
+    chunks = iter_chunks(store, args.zone or ["PT"], start, end, tariff, fetch=not args.offline, seconds=seconds)
+    if not write_export(chunks, args.format, args.output):
+        print(f"No prices available for {start}..{end}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,73 @@
+import os
+import random
+import threading
+import time
+
+from omie import metrics
+
+API_URL = "https://api.energy-charts.info/price"   # OMIE_API_URL overrides it, e.g. for benchmarks.mock_api
+
+CONNECT_TIMEOUT = 3.05
+READ_TIMEOUT = 20
+RETRIES = 3             # extra attempts after the first one
+BACKOFF = 0.5           # base delay in seconds, doubled per attempt
+RETRY_STATUS = {429, 500, 502, 503, 504}
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def get_session():
+    # One keep-alive session shared by every script thread.
+    global _session
+    import requests
+    from requests.adapters import HTTPAdapter
+
+    with _session_lock:
+        if _session is None:
+            _session = requests.Session()
+            adapter = HTTPAdapter(pool_connections=2, pool_maxsize=16)
+            _session.mount("https://", adapter)
+            _session.mount("http://", adapter)
+        return _session
+
+
+def _get(url):
+    import requests  # deferred so headless readers of the store never load it
+
+    for attempt in range(RETRIES + 1):
+        try:
+            response = get_session().get(url, timeout=(CONNECT_TIMEOUT, READ_TIMEOUT))
+            if response.status_code not in RETRY_STATUS or attempt == RETRIES:
+                response.raise_for_status()
+                return response
+        except (requests.ConnectionError, requests.Timeout):
+            if attempt == RETRIES: raise
+        metrics.inc("omie_upstream_requests_total", outcome="retry")
+        # Full jitter so replicas retrying the same outage do not synchronise
+        time.sleep(random.uniform(0, BACKOFF * 2 ** attempt))
+
+
+def fetch_prices(bzn, start, end):
+    # Raw day-ahead points for the inclusive [start, end] day range.
+    import requests
+
+    base_url = os.environ.get("OMIE_API_URL", API_URL)
+    url = f"{base_url}?bzn={bzn}&start={start:%Y-%m-%d}&end={end:%Y-%m-%d}"
+    started = time.perf_counter()
+    try:
+        data = _get(url).json()
+    except requests.HTTPError as e:
+        # energy-charts answers 404 for ranges it has no prices for: an empty answer, not an outage
+        if e.response is None or e.response.status_code != 404:
+            metrics.inc("omie_upstream_requests_total", outcome="error")
+            raise
+        data = {}
+    except Exception:
+        metrics.inc("omie_upstream_requests_total", outcome="error")
+        raise
+    finally:
+        metrics.observe("omie_upstream_seconds", time.perf_counter() - started)
+    metrics.inc("omie_upstream_requests_total", outcome="ok")
+    if 'unix_seconds' not in data or 'price' not in data: return [], []
+    return data['unix_seconds'], data['price']
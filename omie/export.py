@@ -0,0 +1,77 @@
+import csv
+from datetime import timedelta
+
+import numpy as np
+
+from omie.series import local_times, slot_means
+from omie.store import ZONE_TZ
+from omie.tariff import final_prices, period_index
+
+# Chunked exports of long ranges: each chunk of market days is read (and
+# fetched if missing), priced and written before the next one is loaded.
+
+FIELDS = ("zone", "time", "raw_price_mwh", "final_price_kwh")
+CHUNK_DAYS = 31
+
+
+def _numbers(values):
+    return [None if v != v else v for v in np.round(values, 6).tolist()]
+
+
+def iter_chunks(store, zones, start, end, tariff=None, fetch=True, seconds=3600, chunk_days=CHUNK_DAYS):
+    """Yields {field: column} per zone and chunk of days, in the zone's local time.
+
+    Slots are `seconds` long (3600 or 900). Without a tariff final_price_kwh
+    is empty.
+    """
+    for bzn in zones:
+        chunk_start = start
+        while chunk_start <= end:
+            chunk_end = min(end, chunk_start + timedelta(days=chunk_days - 1))
+            if fetch: store.backfill(bzn, chunk_start, chunk_end)
+            slots, raw = slot_means(*store.load_arrays(bzn, chunk_start, chunk_end), seconds)
+            if len(slots):
+                local, hours, weekend = local_times(slots, ZONE_TZ[bzn])
+                final = final_prices(raw, period_index(hours, weekend), tariff) if tariff is not None else np.full(len(raw), np.nan)
+                yield {
+                    "zone": [bzn] * len(raw), "time": [t.isoformat() for t in local],
+                    "raw_price_mwh": _numbers(raw), "final_price_kwh": _numbers(final),
+                }
+            chunk_start = chunk_end + timedelta(days=1)
+
+
+def chunk_rows(chunk):
+    return [dict(zip(FIELDS, row)) for row in zip(*(chunk[f] for f in FIELDS))]
+
+
+def price_rows(store, bzn, start, end, tariff=None, fetch=True, seconds=3600):
+    # One row per slot of `seconds` in the zone's local time, as dicts keyed by FIELDS.
+    # Days published hourly keep one row per hour in quarter-hour mode.
+    chunks = iter_chunks(store, [bzn], start, end, tariff, fetch, seconds)
+    return [row for chunk in chunks for row in chunk_rows(chunk)]
+
+
+def write_csv(chunks, out):
+    # out is a text file; returns the number of rows written
+    writer = csv.writer(out)
+    writer.writerow(FIELDS)
+    n = 0
+    for chunk in chunks:
+        writer.writerows(zip(*(chunk[f] for f in FIELDS)))
+        n += len(chunk["zone"])
+    return n
+
+
+def write_parquet(chunks, out):
+    # One row group per chunk; out is a path or a binary file. Needs pyarrow.
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+
+    schema = pa.schema([("zone", pa.string()), ("time", pa.string()),
+                        ("raw_price_mwh", pa.float64()), ("final_price_kwh", pa.float64())])
+    n = 0
+    with pq.ParquetWriter(out, schema) as writer:
+        for chunk in chunks:
+            writer.write_table(pa.table({f: chunk[f] for f in FIELDS}, schema=schema))
+            n += len(chunk["zone"])
+    return n
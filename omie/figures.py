@@ -0,0 +1,72 @@
+from functools import lru_cache
+
+from omie.tariff import PERIOD_MAP
+
+# Plotly figure specs as plain dicts (st.plotly_chart accepts them directly), so
+# building a chart never imports or validates through plotly.graph_objects.
+
+BAND_COLORS = ("rgba(255, 0, 0, 0.1)", "rgba(255, 255, 0, 0.1)", "rgba(0, 0, 255, 0.1)")
+BAND_FONT_COLORS = ("red", "#b5b500", "blue")
+BAND_ICONS = ("🟥", "𝟨", "🟦")
+
+
+def period_runs(is_weekend):
+    # (first hour, end hour, period) for each run of equal periods in the day
+    row = PERIOD_MAP[int(is_weekend)]
+    runs, start = [], 0
+    for hour in range(1, 25):
+        if hour == 24 or row[hour] != row[start]:
+            runs.append((start, hour, int(row[start])))
+            start = hour
+    return runs
+
+
+@lru_cache(maxsize=64)
+def daily_layout(is_weekend, show_raw, hour_axis, zone_names, slots_per_hour=1):
+    """Static layout of the daily bar chart: one rect per tariff band plus the band legend.
+
+    zone_names is (punta, llano, valle) in the current language; slots_per_hour
+    is 4 when the bars are quarter-hours.
+    """
+    k = slots_per_hour
+    shapes, annotations = [], []
+    if not show_raw:
+        shapes = [
+            dict(type="rect", x0=a * k - 0.5, x1=b * k - 0.5, y0=0, y1=1, xref="x", yref="paper",
+                 fillcolor=BAND_COLORS[p], line=dict(width=0), layer="below")
+            for a, b, p in period_runs(is_weekend)
+        ]
+        # Legend over the first band of each period, at the original label positions
+        label_x = {2: 12} if is_weekend else {2: 3, 1: 10, 0: 17}
+        annotations = [
+            dict(x=x * k, y=1.07, text=f"{BAND_ICONS[p]} {zone_names[p]}", showarrow=False, xref="x", yref="paper",
+                 font=dict(color=BAND_FONT_COLORS[p], size=10))
+            for p, x in label_x.items()
+        ]
+    return dict(
+        xaxis=dict(type="category", fixedrange=True, title=dict(text=hour_axis)),
+        yaxis=dict(fixedrange=True, title=dict(text=None)),
+        coloraxis=dict(colorscale="RdYlGn", reversescale=True, showscale=False),
+        hovermode="x unified",
+        margin=dict(l=10, r=10, t=50, b=10),
+        shapes=tuple(shapes),
+        annotations=tuple(annotations),
+    )
+
+
+def daily_figure(layout, hours, prices, custom_data, title, hovertemplate, now_x=None, fixed_rate=None, fixed_label=None):
+    # Per-rerun parts only: bar data, title, NOW line and the fixed-rate line.
+    shapes, annotations = list(layout["shapes"]), list(layout["annotations"])
+    if fixed_rate is not None:
+        shapes.append(dict(type="line", x0=0, x1=1, xref="paper", y0=fixed_rate, y1=fixed_rate, yref="y",
+                           line=dict(color="#2E86C1", width=3, dash="dash")))
+        annotations.append(dict(x=1, xref="paper", xanchor="right", y=fixed_rate, yref="y", yanchor="bottom",
+                                text=fixed_label, showarrow=False))
+    if now_x is not None:
+        shapes.append(dict(type="line", x0=now_x, x1=now_x, xref="x", y0=0, y1=1, yref="paper",
+                           line=dict(color="black", width=2, dash="dash")))
+    bar = dict(
+        type="bar", x=list(hours), y=list(prices), customdata=custom_data,
+        marker=dict(color=list(prices), coloraxis="coloraxis"), hovertemplate=hovertemplate,
+    )
+    return dict(data=[bar], layout=dict(layout, title=dict(text=title), shapes=shapes, annotations=annotations))
@@ -0,0 +1,126 @@
+import threading
+from datetime import timedelta
+
+import numpy as np
+
+from omie.series import hourly_means, local_times
+from omie.store import MARKET_TZ, day_bounds
+
+# Next-day price estimate for before the 13:30 publication: one ridge
+# regression per market hour on lagged days. Only the normal equations are
+# kept, so a new day is a rank-one update and a refit is a batched 24 x F x F
+# solve; nothing is retrained on the full history.
+
+FIT_DAYS = 365          # history fed to a fresh model
+DECAY = 0.995           # weight kept by older days per new day (half-life ~140 days)
+RIDGE = 1.0             # L2 penalty on everything but the intercept
+LAGS = (1, 2, 7)        # same hour this many days before
+# Features: intercept, lagged same-hour prices, the previous day's mean, weekday dummies (Mon..Sat)
+N_FEATURES = 1 + len(LAGS) + 1 + 6
+
+
+def day_matrix(store, bzn, start, end):
+    """(days, (D, 24) €/MWh) per market day and CET hour over [start, end].
+
+    The 23-hour DST day repeats the hour before the gap, and the 25-hour day
+    averages the repeated hour. Days without prices are left out.
+    """
+    slots, means = hourly_means(*store.load_arrays(bzn, start, end))
+    keep = ~np.isnan(means)
+    if not keep.any(): return [], np.empty((0, 24))
+    local, hours, _ = local_times(slots[keep], MARKET_TZ)
+    days = sorted({d.date() for d in local})
+    row = {d: i for i, d in enumerate(days)}
+    idx = np.array([row[d.date()] for d in local])
+    sums, counts = np.zeros((len(days), 24)), np.zeros((len(days), 24))
+    np.add.at(sums, (idx, hours), means[keep])
+    np.add.at(counts, (idx, hours), 1)
+    with np.errstate(invalid='ignore'):
+        matrix = sums / counts
+    for i in np.flatnonzero(np.isnan(matrix).any(axis=1)):
+        gaps = np.isnan(matrix[i])
+        if gaps.all(): continue
+        filled = np.flatnonzero(~gaps)
+        matrix[i, gaps] = matrix[i, filled[np.clip(np.searchsorted(filled, np.flatnonzero(gaps)) - 1, 0, None)]]
+    full = ~np.isnan(matrix).all(axis=1)
+    return [d for d, ok in zip(days, full) if ok], matrix[full]
+
+
+class Forecaster:
+    """Per-hour ridge regression of a day's prices on the days before it, fed one day at a time."""
+
+    def __init__(self, ridge=RIDGE, decay=DECAY):
+        self.ridge = ridge
+        self.decay = decay
+        self.xtx = np.zeros((24, N_FEATURES, N_FEATURES))
+        self.xty = np.zeros((24, N_FEATURES))
+        self.days = {}          # day -> (24,) prices, only the last max(LAGS) days
+        self.last_day = None
+        self.samples = 0
+        self._coef = None
+        self.lock = threading.Lock()
+
+    def features(self, day):
+        # (24, N_FEATURES) design rows for day, or None while a lag is missing
+        lagged = [self.days.get(day - timedelta(days=lag)) for lag in LAGS]
+        if any(p is None for p in lagged): return None
+        weekday = np.zeros(6)
+        if day.weekday() < 6: weekday[day.weekday()] = 1.0
+        x = np.empty((24, N_FEATURES))
+        x[:, 0] = 1.0
+        x[:, 1:1 + len(LAGS)] = np.column_stack(lagged)
+        x[:, 1 + len(LAGS)] = lagged[0].mean()
+        x[:, 2 + len(LAGS):] = weekday
+        return x
+
+    def observe(self, day, prices):
+        # Adds a finished day (24 CET-hour prices); days must come in order
+        x = self.features(day)
+        if x is not None:
+            self.xtx = self.decay * self.xtx + x[:, :, None] * x[:, None, :]
+            self.xty = self.decay * self.xty + x * prices[:, None]
+            self.samples += 1
+            self._coef = None
+        self.days[day] = np.asarray(prices, dtype=np.float64)
+        for old in [d for d in self.days if (day - d).days >= max(LAGS)]:
+            del self.days[old]
+        self.last_day = day
+
+    @property
+    def coef(self):
+        if self._coef is None:
+            penalty = np.eye(N_FEATURES) * self.ridge
+            penalty[0, 0] = 0.0
+            self._coef = np.linalg.solve(self.xtx + penalty, self.xty[:, :, None])[:, :, 0]
+        return self._coef
+
+    def predict(self, day):
+        """(24,) estimated €/MWh for day, or None without the lagged days.
+
+        Until a few weeks are fitted it falls back to seasonal-naive (a week ago).
+        """
+        x = self.features(day)
+        if x is None: return None
+        if self.samples < 3 * N_FEATURES: return self.days[day - timedelta(days=7)].copy()
+        return np.einsum("hf,hf->h", x, self.coef)
+
+
+def catch_up(forecaster, store, bzn, through):
+    """Feeds the stored days after forecaster.last_day up to through; a fresh
+    model starts FIT_DAYS back. Returns the number of days fed."""
+    start = through - timedelta(days=FIT_DAYS) if forecaster.last_day is None else forecaster.last_day + timedelta(days=1)
+    if start > through: return 0
+    days, matrix = day_matrix(store, bzn, start, through)
+    for day, prices in zip(days, matrix):
+        forecaster.observe(day, prices)
+    return len(days)
+
+
+def forecast_points(forecaster, day, seconds=3600):
+    # (unix seconds, €/MWh) points of the market day every `seconds`, from the 24 CET-hour estimate
+    prices = forecaster.predict(day)
+    if prices is None: return None
+    lo, hi = day_bounds(day, day)
+    ts = np.arange(lo, hi, seconds, dtype=np.int64)
+    _, hours, _ = local_times(ts, MARKET_TZ)
+    return ts, prices[hours]
@@ -0,0 +1,113 @@
+from functools import lru_cache
+
+import numpy as np
+import pandas as pd
+
+from omie.series import align_slots
+from omie.tariff import final_prices, period_index
+
+# Builders for the views, all derived from one frame of raw UTC points
+# ('Timestamp', 'Raw_Price_MWh') as returned by PriceStore.load.
+
+# "HH:MM" for every minute of the day, shared by all label columns
+MINUTE_LABELS = np.array([f"{m // 60:02d}:{m % 60:02d}" for m in range(1440)], dtype=object)
+
+
+@lru_cache(maxsize=8)
+def range_labels(minutes):
+    # "HH:MM - HH:MM" for a slot of `minutes` starting at each minute of the day
+    ends = MINUTE_LABELS[(np.arange(1440) + minutes) % 1440]
+    return np.array([f"{a} - {b}" for a, b in zip(MINUTE_LABELS, ends)], dtype=object)
+
+
+def series_points(series_list):
+    # Points frame from PriceSeries; the cached arrays are only read, never copied into the cache.
+    series_list = [s for s in series_list if s is not None]
+    if not series_list: return None
+    ts = np.concatenate([s.timestamps for s in series_list])
+    prices = np.concatenate([s.prices for s in series_list]).astype(np.float64)
+    keep = ~np.isnan(prices)
+    return pd.DataFrame({'Timestamp': pd.to_datetime(ts[keep], unit='s', utc=True), 'Raw_Price_MWh': prices[keep]})
+
+
+def native_minutes(points):
+    # Spacing of the published points: 60 before the quarter-hour market, 15 after.
+    if len(points) < 2: return 60
+    return max(1, int(points['Timestamp'].diff().dt.total_seconds().median()) // 60)
+
+
+def slot_frame(points, target_tz, minutes=60):
+    local = points.assign(Timestamp=points['Timestamp'].dt.tz_convert(target_tz))
+    return local.set_index('Timestamp').resample(f'{minutes}min').mean()
+
+
+def hourly_frame(points, target_tz):
+    return slot_frame(points, target_tz, 60)
+
+
+def daily_frame(points, target_tz, minutes=60):
+    # One row per slot of `minutes` (96 quarter-hours, or 92/100 on DST days).
+    return add_hour_labels(slot_frame(points, target_tz, minutes).reset_index(), minutes)
+
+
+def slot_label(moment, minutes=60):
+    # Hour_Start of the slot containing a local datetime.
+    return f"{moment.hour:02d}:{moment.minute // minutes * minutes:02d}"
+
+
+def add_hour_labels(df, minutes=60):
+    # Interval strings are looked up in the shared tables rather than formatted per row
+    hour = df['Timestamp'].dt.hour.to_numpy()
+    minute_of_day = hour * 60 + df['Timestamp'].dt.minute.to_numpy()
+    df['Hour_Start'] = MINUTE_LABELS[minute_of_day]
+    df['Hour_End'] = MINUTE_LABELS[(minute_of_day + minutes) % 1440]
+    df['Hour_Range'] = range_labels(minutes)[minute_of_day]
+    df['Hour_Int'] = hour
+    return df
+
+
+def zone_frame(series_by_zone, target_tz, minutes=60, tolerance=0.01):
+    """One row per slot of `minutes` on the zones' common UTC grid, labelled in target_tz.
+
+    A column of €/MWh per zone, plus Spread (max - min across zones) and
+    Coupled: every zone within `tolerance` €/MWh of the others.
+    """
+    arrays = {bzn: (s.timestamps, s.prices) for bzn, s in series_by_zone.items() if s is not None}
+    slots, prices = align_slots(arrays, minutes * 60)
+    if not len(slots): return None
+    df = pd.DataFrame({'Timestamp': pd.to_datetime(slots, unit='s', utc=True).tz_convert(target_tz), **prices})
+    zones = df[list(prices)]
+    df['Spread'] = zones.max(axis=1) - zones.min(axis=1)
+    df['Coupled'] = df['Spread'] <= tolerance
+    return add_hour_labels(df, minutes)
+
+
+def downsample(df, column, max_points):
+    # Keeps the first, the min and the max row of each of max_points // 3 buckets, in order,
+    # so peaks survive when a long series is drawn on a chart max_points wide.
+    if len(df) <= max_points: return df
+    values = df[column].to_numpy()
+    buckets = np.array_split(np.arange(len(df)), max(1, max_points // 3))
+    keep = set()
+    for idx in buckets:
+        if not len(idx): continue
+        part = values[idx]
+        keep.add(idx[0])
+        if not np.isnan(part).all():
+            keep.update((idx[np.nanargmin(part)], idx[np.nanargmax(part)]))
+    return df.iloc[sorted(keep)]
+
+
+def daily_average(points, target_tz, tariff=None):
+    # Local-day means of the hourly prices; with a tariff, each hour gets its own
+    # period fee before averaging (Final_Price).
+    hourly = hourly_frame(points, target_tz).dropna()
+    local = hourly.index
+    codes, days = pd.factorize(local.normalize())
+    counts = np.bincount(codes)
+    raw = hourly['Raw_Price_MWh'].to_numpy()
+    out = pd.DataFrame({'Date': days.date, 'Raw_Price_MWh': np.bincount(codes, raw) / counts})
+    if tariff is not None:
+        periods = period_index(local.hour, local.dayofweek >= 5)
+        out['Final_Price'] = np.bincount(codes, final_prices(raw, periods, tariff)) / counts
+    return out
@@ -0,0 +1,150 @@
+import json
+import logging
+import os
+import threading
+import time
+from contextlib import contextmanager
+from functools import wraps
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+log = logging.getLogger(__name__)
+
+# Process-wide counters and timing histograms in the Prometheus text format.
+# Set OMIE_METRICS_PORT to serve them on /metrics, and OMIE_METRICS_LOG=1 to
+# also log one JSON line with the stage timings of every rerun.
+
+BUCKETS = (0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30)
+HELP = {
+    "omie_stage_seconds": ("histogram", "Wall time of an app or pipeline stage."),
+    "omie_upstream_seconds": ("histogram", "Latency of energy-charts requests, retries included."),
+    "omie_upstream_requests_total": ("counter", "energy-charts requests by outcome."),
+    "omie_store_days_total": ("counter", "Days asked of PriceStore.backfill: stored (hit) or due for fetching (miss)."),
+    "omie_cache_requests_total": ("counter", "Lookups of a Streamlit-cached loader."),
+    "omie_cache_misses_total": ("counter", "Lookups of a Streamlit-cached loader that ran the loader."),
+    "omie_alerts_total": ("counter", "Price-alert notifications produced, by zone."),
+    "omie_snapshot_requests_total": ("counter", "Default-view snapshot lookups: on disk (hit) or rendered (miss)."),
+    "omie_api_requests_total": ("counter", "JSON price API responses, by status."),
+}
+
+
+def _label_str(labels, extra=()):
+    items = list(labels) + list(extra)
+    if not items: return ""
+    return "{" + ",".join(f'{k}="{v}"' for k, v in items) + "}"
+
+
+class Registry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counters = {}     # (name, labels) -> value
+        self._histograms = {}   # (name, labels) -> [count per bucket..., +Inf count, sum]
+        self._local = threading.local()
+
+    def inc(self, name, value=1, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + value
+
+    def observe(self, name, seconds, **labels):
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            hist = self._histograms.get(key)
+            if hist is None: hist = self._histograms[key] = [0] * (len(BUCKETS) + 1) + [0.0]
+            for i, bound in enumerate(BUCKETS):
+                if seconds <= bound: hist[i] += 1
+            hist[-2] += 1
+            hist[-1] += seconds
+
+    @contextmanager
+    def span(self, stage):
+        # Times a stage; inside a trace (one rerun on this thread) it is also added to the trace
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            elapsed = time.perf_counter() - start
+            self.observe("omie_stage_seconds", elapsed, stage=stage)
+            trace = getattr(self._local, "trace", None)
+            if trace is not None: trace[stage] = trace.get(stage, 0.0) + elapsed
+
+    def start_trace(self):
+        # Streamlit runs each session's script on its own thread
+        self._local.trace = {}
+
+    def end_trace(self, **fields):
+        trace, self._local.trace = getattr(self._local, "trace", None), None
+        if trace is not None and os.environ.get("OMIE_METRICS_LOG") == "1":
+            log.info(json.dumps(dict(fields, stages={k: round(v, 6) for k, v in trace.items()})))
+        return trace
+
+    def render(self):
+        with self._lock:
+            counters = dict(self._counters)
+            histograms = {k: list(v) for k, v in self._histograms.items()}
+        lines = []
+        for name in sorted({n for n, _ in counters} | {n for n, _ in histograms}):
+            kind, text = HELP.get(name, ("untyped", name))
+            lines += [f"# HELP {name} {text}", f"# TYPE {name} {kind}"]
+            for (n, labels), value in sorted(counters.items()):
+                if n == name: lines.append(f"{name}{_label_str(labels)} {value}")
+            for (n, labels), hist in sorted(histograms.items()):
+                if n != name: continue
+                for bound, count in zip(BUCKETS, hist):
+                    lines.append(f"{name}_bucket{_label_str(labels, [('le', bound)])} {count}")
+                lines.append(f"{name}_bucket{_label_str(labels, [('le', '+Inf')])} {hist[-2]}")
+                lines.append(f"{name}_sum{_label_str(labels)} {hist[-1]:.6f}")
+                lines.append(f"{name}_count{_label_str(labels)} {hist[-2]}")
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+inc = REGISTRY.inc
+observe = REGISTRY.observe
+span = REGISTRY.span
+start_trace = REGISTRY.start_trace
+end_trace = REGISTRY.end_trace
+
+
+def log_to_stderr():
+    # JSON rerun lines on stderr, one per line, whatever the host's logging setup
+    if any(getattr(h, "omie", False) for h in log.handlers): return
+    handler = logging.StreamHandler()
+    handler.setFormatter(logging.Formatter("%(message)s"))
+    handler.omie = True
+    log.addHandler(handler)
+    log.setLevel(logging.INFO)
+
+
+def timed(stage):
+    # Decorator form of span()
+    def decorate(fn):
+        @wraps(fn)
+        def wrapper(*args, **kwargs):
+            with span(stage):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
+
+
+def serve(port, registry=REGISTRY):
+    """Serves registry.render() on http://0.0.0.0:port/metrics from a daemon thread."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] != "/metrics":
+                self.send_error(404)
+                return
+            body = registry.render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("0.0.0.0", port), Handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="omie-metrics", daemon=True).start()
+    return server
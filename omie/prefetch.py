@@ -0,0 +1,109 @@
+import logging
+import os
+import threading
+from datetime import date, datetime, time, timedelta
+
+import pytz
+
+from omie import metrics
+from omie.forecast import FIT_DAYS
+from omie.store import MARKET_TZ, MIBEL_ZONES, PriceStore, market_today
+
+log = logging.getLogger(__name__)
+
+ZONES = MIBEL_ZONES
+PUBLICATION_TIME = (13, 30)     # day-ahead results land after 13:30 CET
+POLL_INTERVAL = 300             # seconds between polls while tomorrow is missing
+WARM_DAYS = max(30, FIT_DAYS)   # history kept warm behind today, enough to fit the forecast
+HISTORY_START = date(2015, 1, 1)    # first day of the history tab
+
+
+def next_run(now, tomorrow_ready):
+    # Sleep until publication, poll until tomorrow is stored, then wait for the next day.
+    tz = pytz.timezone(MARKET_TZ)
+    published_at = tz.localize(datetime.combine(now.date(), time(*PUBLICATION_TIME)))
+    if now < published_at: return published_at
+    if not tomorrow_ready: return now + timedelta(seconds=POLL_INTERVAL)
+    return tz.localize(datetime.combine(now.date() + timedelta(days=1), time(*PUBLICATION_TIME)))
+
+
+class Prefetcher(threading.Thread):
+    """Daemon thread that keeps today, tomorrow and the history window stored for every zone.
+
+    The window covers the forecast's fit days and, once tomorrow is checked,
+    everything back to HISTORY_START, so the forecast and history views never
+    fetch in a rerun.
+
+    on_ready([today, tomorrow]) is called once per publication, after tomorrow
+    is stored for every zone (e.g. to pre-render snapshots). on_day(today) is
+    called at startup and at every market midnight (e.g. to re-point today's page).
+    """
+
+    def __init__(self, store, zones=ZONES, on_ready=None, on_day=None):
+        super().__init__(name="omie-prefetch", daemon=True)
+        self.store = store
+        self.zones = zones
+        self.on_ready = on_ready
+        self.on_day = on_day
+        self.published = None       # last tomorrow handed to on_ready
+        self.day = None             # last today handed to on_day
+        self.stop_event = threading.Event()
+
+    def warm(self):
+        today = market_today()
+        tomorrow = today + timedelta(days=1)
+        self.store.backfill_zones(self.zones, today - timedelta(days=WARM_DAYS), tomorrow)
+        ready = all(tomorrow in self.store.stored_days(bzn, tomorrow, tomorrow) for bzn in self.zones)
+        # Only a cold store has gaps this far back; days upstream lacks are left alone for EMPTY_TTL
+        self.store.backfill_zones(self.zones, HISTORY_START, today - timedelta(days=WARM_DAYS + 1))
+        return ready
+
+    def run(self):
+        tz = pytz.timezone(MARKET_TZ)
+        while not self.stop_event.is_set():
+            try:
+                ready = self.warm()
+            except Exception:
+                log.warning("Prefetch failed", exc_info=True)
+                ready = False
+            tomorrow = market_today() + timedelta(days=1)
+            if ready and self.on_ready is not None and self.published != tomorrow:
+                try:
+                    self.on_ready([tomorrow - timedelta(days=1), tomorrow])
+                    self.published = tomorrow
+                except Exception:
+                    log.warning("Publication hook failed", exc_info=True)
+            today = tomorrow - timedelta(days=1)
+            if self.on_day is not None and self.day != today:
+                try:
+                    self.on_day(today)
+                    self.day = today
+                except Exception:
+                    log.warning("Day hook failed", exc_info=True)
+            now = datetime.now(tz)
+            wake = next_run(now, ready)
+            if self.on_day is not None:
+                wake = min(wake, tz.localize(datetime.combine(now.date() + timedelta(days=1), time())))
+            log.info("Next prefetch at %s", wake)
+            self.stop_event.wait((wake - now).total_seconds())
+
+    def stop(self):
+        self.stop_event.set()
+
+
+def start_prefetcher(store, on_ready=None, on_day=None):
+    prefetcher = Prefetcher(store, on_ready=on_ready, on_day=on_day)
+    prefetcher.start()
+    return prefetcher
+
+
+if __name__ == "__main__":
+    # Standalone worker: python -m omie.prefetch
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(message)s")
+    if os.environ.get("OMIE_METRICS_PORT"): metrics.serve(int(os.environ["OMIE_METRICS_PORT"]))
+    worker = Prefetcher(PriceStore())
+    worker.start()
+    try:
+        worker.join()
+    except KeyboardInterrupt:
+        worker.stop()
@@ -0,0 +1,116 @@
+import math
+from dataclasses import dataclass
+
+import numpy as np
+
+
+@dataclass(frozen=True)
+class Load:
+    name: str
+    power_w: float
+    duration_h: float
+    earliest: int = 0           # first allowed start slot
+    latest: int = None          # last allowed start slot (None: any start that fits)
+
+
+@dataclass(frozen=True)
+class Plan:
+    starts: dict                # load name -> start slot
+    costs: dict                 # load name -> € for that run
+    total_cost: float
+
+
+def window_costs(prices, duration_slots):
+    """Sum of prices over every window of duration_slots (may be fractional).
+
+    Works on the last axis, so a (users, slots) array is evaluated in one call.
+    Windows that run past the horizon or touch a NaN price cost inf.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    n = prices.shape[-1]
+    full = int(math.floor(duration_slots + 1e-9))
+    frac = duration_slots - full if duration_slots - full > 1e-9 else 0.0
+    span = full + (1 if frac else 0)
+    out = np.full(prices.shape, np.inf)
+    if span == 0 or span > n: return out
+
+    missing = np.isnan(prices)
+    pad = [(0, 0)] * (prices.ndim - 1) + [(1, 0)]
+    csum = np.pad(np.cumsum(np.where(missing, 0.0, prices), axis=-1), pad)
+    cmiss = np.pad(np.cumsum(missing, axis=-1), pad)
+    starts = n - span + 1
+    total = csum[..., full:full + starts] - csum[..., :starts]
+    if frac: total = total + frac * np.where(missing, 0.0, prices)[..., full:full + starts]
+    gaps = cmiss[..., span:span + starts] - cmiss[..., :starts]
+    out[..., :starts] = np.where(gaps > 0, np.inf, total)
+    return out
+
+
+def _load_costs(prices, load, slot_hours):
+    costs = window_costs(prices, load.duration_h / slot_hours) * (load.power_w / 1000) * slot_hours
+    costs[:load.earliest] = np.inf
+    if load.latest is not None: costs[load.latest + 1:] = np.inf
+    return costs
+
+
+def _span(load, slot_hours):
+    return int(math.ceil(load.duration_h / slot_hours - 1e-9))
+
+
+def schedule(prices, loads, slot_hours=1.0, no_overlap=False, max_power_w=None):
+    """Cheapest start slot for every load over a price horizon (€/kWh per slot).
+
+    Without constraints each load takes its own minimum. With no_overlap or
+    max_power_w, a branch-and-bound search over starts (cheapest first, bounded
+    by the unconstrained minima) returns the optimal joint plan. Returns None
+    when no feasible plan exists.
+    """
+    prices = np.asarray(prices, dtype=np.float64)
+    n = len(prices)
+    costs = [_load_costs(prices, load, slot_hours) for load in loads]
+    spans = [_span(load, slot_hours) for load in loads]
+    mins = [c.min() for c in costs]
+    if any(not np.isfinite(m) for m in mins): return None
+    if max_power_w is not None and any(load.power_w > max_power_w for load in loads): return None
+
+    def plan_of(starts):
+        return Plan(
+            starts={load.name: int(s) for load, s in zip(loads, starts)},
+            costs={load.name: float(c[s]) for load, c, s in zip(loads, costs, starts)},
+            total_cost=float(sum(c[s] for c, s in zip(costs, starts))),
+        )
+
+    greedy = [int(c.argmin()) for c in costs]
+    if not no_overlap and max_power_w is None: return plan_of(greedy)
+
+    # Most constrained loads first so infeasible branches are cut early
+    order = sorted(range(len(loads)), key=lambda i: np.isfinite(costs[i]).sum())
+    candidates = {i: np.argsort(costs[i], kind='stable')[:np.isfinite(costs[i]).sum()] for i in order}
+    rest_bound = np.concatenate([np.cumsum([mins[i] for i in order][::-1])[::-1], [0.0]])
+    power = np.zeros(n)
+    count = np.zeros(n, dtype=np.int64)
+    starts = [0] * len(loads)
+    best = {'cost': np.inf, 'starts': None}
+
+    def search(depth, partial):
+        if depth == len(order):
+            best['cost'], best['starts'] = partial, list(starts)
+            return
+        i = order[depth]
+        load, span = loads[i], spans[i]
+        for s in candidates[i]:
+            cost = partial + costs[i][s]
+            if cost + rest_bound[depth + 1] >= best['cost']: break
+            window = slice(s, s + span)
+            if no_overlap and count[window].any(): continue
+            if max_power_w is not None and (power[window] + load.power_w > max_power_w).any(): continue
+            power[window] += load.power_w
+            count[window] += 1
+            starts[i] = int(s)
+            search(depth + 1, cost)
+            power[window] -= load.power_w
+            count[window] -= 1
+
+    search(0, 0.0)
+    if best['starts'] is None: return None
+    return plan_of(best['starts'])
@@ -0,0 +1,71 @@
+from dataclasses import dataclass
+from datetime import datetime
+
+import numpy as np
+import pytz
+
+# Pandas-free helpers over (unix seconds, price) arrays, for headless callers.
+
+
+@dataclass(frozen=True, eq=False)
+class PriceSeries:
+    # Raw €/MWh on a regular grid: slot i starts at start + i * step (unix seconds).
+    # prices is a read-only float32 array, so one instance can be shared by every session.
+    start: int
+    step: int
+    prices: np.ndarray
+
+    def __len__(self):
+        return len(self.prices)
+
+    @property
+    def timestamps(self):
+        return self.start + self.step * np.arange(len(self.prices), dtype=np.int64)
+
+
+def price_series(ts, prices):
+    # Packs sorted (unix seconds, price) points into a PriceSeries; gaps become NaN.
+    ts = np.asarray(ts, dtype=np.int64)
+    if len(ts) == 0: return None
+    step = int(np.diff(ts).min()) if len(ts) > 1 else 3600
+    grid = np.full((ts[-1] - ts[0]) // step + 1, np.nan, dtype=np.float32)
+    grid[(ts - ts[0]) // step] = prices
+    grid.flags.writeable = False
+    return PriceSeries(int(ts[0]), step, grid)
+
+
+def slot_means(ts, prices, seconds=3600):
+    # Mean price per slot; Iberian UTC offsets are whole hours, so UTC and local slots coincide.
+    ts = np.asarray(ts, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    hours, codes = np.unique(ts - ts % seconds, return_inverse=True)
+    valid = ~np.isnan(prices)
+    sums = np.bincount(codes, np.where(valid, prices, 0.0), minlength=len(hours))
+    counts = np.bincount(codes, valid, minlength=len(hours))
+    with np.errstate(invalid='ignore', divide='ignore'):
+        return hours, sums / counts
+
+
+def align_slots(arrays, seconds=3600):
+    # {bzn: (ts, prices)} -> (UTC slot starts of every zone, {bzn: mean per slot}), NaN where a zone has none.
+    means = {bzn: slot_means(ts, prices, seconds) for bzn, (ts, prices) in arrays.items() if len(ts)}
+    if not means: return np.array([], dtype=np.int64), {}
+    slots = np.unique(np.concatenate([s for s, _ in means.values()]))
+    out = {}
+    for bzn, (s, m) in means.items():
+        out[bzn] = np.full(len(slots), np.nan)
+        out[bzn][np.searchsorted(slots, s)] = m
+    return slots, out
+
+
+def hourly_means(ts, prices):
+    return slot_means(ts, prices, 3600)
+
+
+def local_times(ts, tz_name):
+    # (local datetimes, hour, is_weekend) for each timestamp.
+    tz = pytz.timezone(tz_name)
+    local = [datetime.fromtimestamp(int(t), tz) for t in ts]
+    hours = np.array([d.hour for d in local], dtype=np.intp)
+    weekend = np.array([d.weekday() >= 5 for d in local], dtype=bool)
+    return local, hours, weekend
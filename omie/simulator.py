@@ -0,0 +1,120 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+from omie.series import slot_means
+from omie.tariff import final_prices_batch, period_index
+
+# Yearly cost of a metered load curve under dynamic pricing and under fixed
+# rates, all configs in one pass over the curve.
+
+
+@dataclass(frozen=True)
+class Simulation:
+    months: list            # "YYYY-MM" per column
+    kwh: np.ndarray         # (M,) consumption per month
+    dynamic: np.ndarray     # (C, M) € per tariff config and month
+    fixed: np.ndarray       # (N, M) € per fixed rate and month
+    coverage: float         # share of the consumption that had a market price
+
+    @property
+    def dynamic_total(self):
+        return self.dynamic.sum(axis=1)
+
+    @property
+    def fixed_total(self):
+        return self.fixed.sum(axis=1)
+
+
+def read_profile(source, tz_name):
+    """(slot start unix seconds, kWh, slot seconds) from a smart-meter CSV.
+
+    Takes the first column that parses as timestamps (local time of tz_name),
+    joined with the next one when that holds the time of day (e.g. e-Redes'
+    Data;Hora;Consumo), and the last numeric one as kWh; ';' separators and
+    decimal commas work. Split clocks that mark the end of each interval
+    (24:00, or a first reading at 00:15 or 01:00) are moved back one slot.
+    Repeated timestamps are rejected.
+    """
+    import pandas as pd
+
+    df = pd.read_csv(source, sep=None, engine="python")
+    times = kwh = None
+    ends = False            # clocks mark the end of each interval
+    columns = list(df.columns)
+    for i, col in enumerate(columns):
+        values = df[col]
+        if not pd.api.types.is_numeric_dtype(values):
+            text = values.astype(str)
+            values = pd.to_numeric(text.str.replace(",", ".", regex=False), errors="coerce")
+            if times is None and values.notna().mean() <= 0.9:
+                parsed = pd.to_datetime(text, errors="coerce", dayfirst=text.str.match(r"\d{1,2}[/.-]").mean() > 0.5)
+                if parsed.notna().mean() > 0.9:
+                    times = parsed
+                    clock = df[columns[i + 1]].astype(str).str.strip() if i + 1 < len(columns) else None
+                    if clock is not None and clock.str.fullmatch(r"\d{1,2}:\d{2}(:\d{2})?").mean() > 0.9:
+                        # Time of day in its own column: added as an offset, so 24:00 is the next midnight
+                        times = parsed.dt.normalize() + pd.to_timedelta(clock.where(clock.str.count(":") == 2, clock + ":00"), errors="coerce")
+                        hm = clock.str.extract(r"^(\d{1,2}):(\d{2})").astype(float)
+                        ends = bool((hm[0] == 24).any()) or (hm[0].iloc[0], hm[1].iloc[0]) in ((0, 15), (1, 0))
+                continue
+        if values.notna().mean() > 0.9: kwh = values
+    if times is None or kwh is None: raise ValueError("expected a timestamp column and a kWh column")
+    keep = times.notna() & kwh.notna()
+    times, kwh = pd.DatetimeIndex(times[keep]), kwh[keep].to_numpy(dtype=np.float64)
+    if ends and len(times) > 1:
+        times = times - pd.Series(times.sort_values()).diff().median()
+    if times.tz is None:
+        try:
+            times = times.tz_localize(tz_name, ambiguous="infer", nonexistent="NaT")
+        except Exception:
+            # No repeated hour to infer the DST fall-back from
+            times = times.tz_localize(tz_name, ambiguous="NaT", nonexistent="NaT")
+    valid = ~times.isna()
+    ts = times[valid].tz_convert("UTC").tz_localize(None).values.astype("datetime64[s]").astype(np.int64)
+    kwh = kwh[valid]
+    order = np.argsort(ts, kind="stable")
+    ts, kwh = ts[order], kwh[order]
+    if (np.diff(ts) == 0).any(): raise ValueError("the profile repeats timestamps; expected one reading per slot")
+    step = int(np.median(np.diff(ts))) if len(ts) > 1 else 3600
+    return ts, kwh, 900 if step <= 900 else 3600
+
+
+def slot_prices(store_ts, store_prices, ts, step):
+    # Raw €/MWh for each slot start in ts: quarter-hour prices where published, else the hourly mean.
+    out = np.full(len(ts), np.nan)
+    for seconds in ((3600, 900) if step == 900 else (3600,)):
+        slots, means = slot_means(store_ts, store_prices, seconds)
+        if not len(slots): continue
+        key = ts - ts % seconds
+        idx = np.clip(np.searchsorted(slots, key), 0, len(slots) - 1)
+        found = (slots[idx] == key) & ~np.isnan(means[idx])
+        out[found] = means[idx[found]]
+    return out
+
+
+def simulate(ts, kwh, raw_mwh, tz_name, configs, fixed_rates, vat):
+    """Monthly costs of the load curve (ts, kwh) for every config and fixed rate.
+
+    raw_mwh is the market price of each slot (NaN where missing). Fixed rates
+    are €/kWh before VAT, like the app's fixed_val. Slots without a price are
+    left out of both sides so the comparison stays like for like.
+    """
+    import pandas as pd
+
+    local = pd.to_datetime(ts, unit="s", utc=True).tz_convert(tz_name)
+    month_index = local.year.to_numpy() * 12 + local.month.to_numpy() - 1
+    keys, codes = np.unique(month_index, return_inverse=True)
+    months = [f"{k // 12}-{k % 12 + 1:02d}" for k in keys]
+    onehot = np.zeros((len(ts), len(months)))
+    onehot[np.arange(len(ts)), codes] = 1.0
+
+    priced = ~np.isnan(raw_mwh)
+    periods = period_index(local.hour, local.dayofweek >= 5)
+    final = final_prices_batch(np.where(priced, raw_mwh, 0.0), periods, configs)     # (C, T) €/kWh
+    priced_kwh = np.where(priced, kwh, 0.0)
+    dynamic = (final * priced_kwh) @ onehot
+    fixed = np.outer(np.asarray(fixed_rates, dtype=np.float64) * (1 + vat), priced_kwh @ onehot)
+    total = kwh.sum()
+    coverage = float(kwh[priced].sum() / total) if total else 0.0
+    return Simulation(list(months), kwh @ onehot, dynamic, fixed, coverage)
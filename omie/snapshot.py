@@ -0,0 +1,101 @@
+import html
+import json
+import os
+import tempfile
+from functools import lru_cache
+
+# Pre-rendered default views: one JSON payload the app hydrates from, plus a
+# standalone HTML page per day, zone and language. The default directory is
+# Streamlit's static folder, so with server.enableStaticServing the pages are
+# served as is at /app/static/snapshots/<name>.html, without running the script.
+
+DEFAULT_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "static", "snapshots")
+PLOTLY_JS = "https://cdn.plot.ly/plotly-{version}.min.js"
+
+
+def snapshot_dir():
+    return os.environ.get("OMIE_SNAPSHOT_DIR", DEFAULT_DIR)
+
+
+def snapshot_name(day, bzn, lang):
+    return f"{day:%Y-%m-%d}_{bzn}_{lang}"
+
+
+def _write_text(path, text):
+    # Readers in other processes see the old file or the new one, never a partial write
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(path), suffix=".tmp")
+    try:
+        with os.fdopen(fd, "w", encoding="utf-8") as f:
+            f.write(text)
+        os.chmod(tmp, 0o644)     # mkstemp files are private; these are served to anyone
+        os.replace(tmp, path)
+    except BaseException:
+        os.unlink(tmp)
+        raise
+
+
+def write_snapshot(directory, name, payload, page=None, alias=None):
+    """Writes <name>.json and, with page, <name>.html; alias also gets a copy of the page."""
+    os.makedirs(directory, exist_ok=True)
+    _write_text(os.path.join(directory, f"{name}.json"), json.dumps(payload, separators=(",", ":")))
+    if page is None: return
+    _write_text(os.path.join(directory, f"{name}.html"), page)
+    if alias: _write_text(os.path.join(directory, f"{alias}.html"), page)
+
+
+def alias_snapshot(directory, name, alias):
+    # Copies an existing <name>.html to <alias>.html; False when there is no such page
+    try:
+        with open(os.path.join(directory, f"{name}.html"), encoding="utf-8") as f:
+            page = f.read()
+    except OSError:
+        return False
+    _write_text(os.path.join(directory, f"{alias}.html"), page)
+    return True
+
+
+@lru_cache(maxsize=64)
+def _load(path, mtime_ns):
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+
+def read_snapshot(directory, name):
+    # Parsed payload, or None; re-read only when the file changes
+    path = os.path.join(directory, f"{name}.json")
+    try:
+        return _load(path, os.stat(path).st_mtime_ns)
+    except (OSError, ValueError):
+        return None
+
+
+def render_page(title, lang, summary, figures, link, link_text):
+    """Self-contained HTML page: a title, (label, value) summary cards, plotly
+    figure dicts (numpy values allowed) drawn by plotly.js from the CDN, and a
+    link to the live app."""
+    from plotly.offline import get_plotlyjs_version
+    from plotly.utils import PlotlyJSONEncoder
+
+    cards = "".join(f"<div class=card><div>{html.escape(label)}</div><b>{html.escape(value)}</b></div>"
+                    for label, value in summary)
+    divs = "".join(f"<div id=fig{i} class=fig></div>" for i in range(len(figures)))
+    plots = "".join(f"Plotly.newPlot('fig{i}',{json.dumps(fig['data'], cls=PlotlyJSONEncoder)},"
+                    f"{json.dumps(fig['layout'], cls=PlotlyJSONEncoder)},"
+                    f"{{displayModeBar:false,responsive:true}});" for i, fig in enumerate(figures))
+    return f"""<!DOCTYPE html>
+<html lang="{lang}"><head><meta charset="utf-8">
+<meta name="viewport" content="width=device-width, initial-scale=1">
+<title>{html.escape(title)}</title>
+<script src="{PLOTLY_JS.format(version=get_plotlyjs_version())}"></script>
+<style>
+body{{font-family:sans-serif;max-width:1100px;margin:auto;padding:1rem}}
+.cards{{display:flex;gap:1rem;flex-wrap:wrap}}.card{{flex:1;min-width:10rem;padding:.5rem 1rem;border:1px solid #ddd;border-radius:.5rem}}
+.card b{{font-size:1.6rem}}.fig{{height:450px}}
+</style></head><body>
+<h1>{html.escape(title)}</h1>
+<p><a href="{html.escape(link)}">{html.escape(link_text)}</a></p>
+<div class=cards>{cards}</div>
+{divs}
+<script>{plots}</script>
+</body></html>
+"""
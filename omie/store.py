@@ -0,0 +1,409 @@
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from datetime import datetime, timedelta
+
+import numpy as np
+import pytz
+
+from omie import metrics
+from omie.energy_charts import fetch_prices
+from omie.series import hourly_means, price_series
+from omie.tariff import period_index
+
+log = logging.getLogger(__name__)
+
+# Day-ahead market days are CET for every coupled zone, ES and PT included.
+MARKET_TZ = 'Europe/Madrid'
+ZONE_TZ = {"ES": 'Europe/Madrid', "PT": 'Europe/Lisbon', "FR": 'Europe/Paris', "DE-LU": 'Europe/Berlin'}
+MIBEL_ZONES = ("ES", "PT")      # the zones the Iberian tariffs apply to
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "data", "prices.sqlite")
+PARTIAL_TTL = 3600      # seconds before an incomplete day is fetched again
+FAILURE_TTL = 60        # seconds a failed day is left alone before retrying
+EMPTY_TTL = 7 * 86400   # seconds a past day upstream has no prices for is left alone
+WAIT_TIMEOUT = 30       # seconds to wait on another thread or process fetching a day we lack
+LEASE_TTL = 120         # seconds a fetch claim holds before another process may take it over
+POLL_INTERVAL = 0.1     # seconds between checks on a fetch running in another process
+MAX_SPAN_DAYS = 92      # largest date range sent upstream in one request
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS prices (
+    bzn TEXT NOT NULL,
+    ts INTEGER NOT NULL,
+    price REAL,
+    PRIMARY KEY (bzn, ts)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS days (
+    bzn TEXT NOT NULL,
+    day TEXT NOT NULL,
+    fetched_at REAL NOT NULL,
+    final INTEGER NOT NULL,
+    PRIMARY KEY (bzn, day)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS rollups (
+    bzn TEXT NOT NULL,
+    grain TEXT NOT NULL,
+    key TEXT NOT NULL,
+    mean REAL,
+    min REAL,
+    max REAL,
+    p10 REAL,
+    p50 REAL,
+    p90 REAL,
+    hours INTEGER NOT NULL,
+    p1_hours INTEGER NOT NULL,
+    p2_hours INTEGER NOT NULL,
+    p3_hours INTEGER NOT NULL,
+    PRIMARY KEY (bzn, grain, key)
+) WITHOUT ROWID;
+CREATE TABLE IF NOT EXISTS fetches (
+    bzn TEXT NOT NULL,
+    day TEXT NOT NULL,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    failed INTEGER NOT NULL,
+    PRIMARY KEY (bzn, day)
+) WITHOUT ROWID;
+"""
+
+
+def market_today():
+    return datetime.now(pytz.timezone(MARKET_TZ)).date()
+
+
+def day_bounds(start, end):
+    # Unix seconds of [start 00:00, end+1 00:00) in market time.
+    tz = pytz.timezone(MARKET_TZ)
+    lo = tz.localize(datetime.combine(start, datetime.min.time()))
+    hi = tz.localize(datetime.combine(end + timedelta(days=1), datetime.min.time()))
+    return int(lo.timestamp()), int(hi.timestamp())
+
+
+def _month_start(d):
+    return d.replace(day=1)
+
+
+def _month_end(d):
+    return (d.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+
+
+def _date_range(start, end):
+    return [start + timedelta(days=i) for i in range((end - start).days + 1)]
+
+
+def _spans(days):
+    # Groups sorted days into contiguous (start, end) spans of at most MAX_SPAN_DAYS.
+    spans = []
+    for d in days:
+        if spans and d - spans[-1][1] == timedelta(days=1) and (d - spans[-1][0]).days < MAX_SPAN_DAYS:
+            spans[-1][1] = d
+        else:
+            spans.append([d, d])
+    return [tuple(s) for s in spans]
+
+
+class PriceStore:
+    """On-disk SQLite store of raw day-ahead prices keyed by (zone, UTC timestamp).
+
+    Complete and past days are immutable and never fetched twice; only the
+    missing days of a requested range are sent upstream. Failed fetches are
+    retried after a short FAILURE_TTL, past days upstream has nothing for
+    after EMPTY_TTL, and stored data is served while a refresh is failing or
+    in flight.
+
+    Fetches are single-flight across every thread and process sharing the
+    file: a day is leased in the fetches table before it is sent upstream,
+    and other processes wait for the lease instead of fetching it again.
+    """
+
+    def __init__(self, path=None, partial_ttl=PARTIAL_TTL, failure_ttl=FAILURE_TTL, empty_ttl=EMPTY_TTL, fetcher=fetch_prices):
+        # OMIE_STORE_PATH is read here rather than at import so callers can set it late
+        path = path or os.environ.get("OMIE_STORE_PATH", DEFAULT_PATH)
+        self.path = path
+        self.partial_ttl = partial_ttl
+        self.failure_ttl = failure_ttl
+        self.empty_ttl = empty_ttl
+        self.fetcher = fetcher
+        self._lock = threading.Lock()
+        self._inflight = {}     # (bzn, day) -> Event set when its fetch finishes
+        self._failed = {}       # (bzn, day) -> time before which it is not fetched again
+        self._owner = uuid.uuid4().hex
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        with self._connect() as conn:
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.executescript(SCHEMA)
+
+    @contextmanager
+    def _connect(self):
+        conn = sqlite3.connect(self.path, timeout=30)
+        try:
+            with conn: yield conn
+        finally:
+            conn.close()
+
+    def _due_days(self, bzn, start, end, conn=None):
+        # (day, has_data) for every day of [start, end] that needs fetching.
+        if conn is None:
+            with self._connect() as conn: return self._due_days(bzn, start, end, conn)
+        rows = conn.execute(
+            "SELECT day, fetched_at, final FROM days WHERE bzn = ? AND day BETWEEN ? AND ?",
+            (bzn, start.isoformat(), end.isoformat()),
+        ).fetchall()
+        known = {day: (fetched_at, final) for day, fetched_at, final in rows}
+        now = time.time()
+        due = []
+        for d in _date_range(start, end):
+            entry = known.get(d.isoformat())
+            if entry is None: due.append((d, False))
+            elif not entry[1] and now - entry[0] > self.partial_ttl: due.append((d, True))
+        return due
+
+    def missing_days(self, bzn, start, end):
+        return [d for d, _ in self._due_days(bzn, start, end)]
+
+    def stored_days(self, bzn, start, end):
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT day FROM days WHERE bzn = ? AND day BETWEEN ? AND ?",
+                (bzn, start.isoformat(), end.isoformat()),
+            ).fetchall()
+        return {datetime.strptime(day, "%Y-%m-%d").date() for (day,) in rows}
+
+    def final_days(self, bzn, start, end):
+        # Stored days whose prices will not change any more
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT day FROM days WHERE bzn = ? AND day BETWEEN ? AND ? AND final",
+                (bzn, start.isoformat(), end.isoformat()),
+            ).fetchall()
+        return {datetime.strptime(day, "%Y-%m-%d").date() for (day,) in rows}
+
+    def backfill(self, bzn, start, end):
+        # Fetches only the missing days of [start, end]; returns the number of upstream calls.
+        now = time.time()
+        todo, waits = [], []
+        due = self._due_days(bzn, start, end)
+        metrics.inc("omie_store_days_total", (end - start).days + 1 - len(due), result="hit")
+        metrics.inc("omie_store_days_total", len(due), result="miss")
+        with self._lock:
+            for d, has_data in due:
+                key = (bzn, d)
+                if now < self._failed.get(key, 0): continue
+                event = self._inflight.get(key)
+                if event is not None:
+                    # Stale data is served as is; a day we lack is worth waiting for
+                    if not has_data: waits.append(event)
+                    continue
+                self._inflight[key] = threading.Event()
+                todo.append(d)
+
+        calls = 0
+        try:
+            claimed, remote = self._claim(bzn, todo)
+            for span_start, span_end in _spans(claimed):
+                calls += 1
+                written, answered = set(), False
+                try:
+                    unix_seconds, prices = self.fetcher(bzn, span_start, span_end)
+                    written = self._write(bzn, span_start, span_end, unix_seconds, prices)
+                    answered = True
+                except Exception:
+                    log.warning("Fetching %s %s..%s failed", bzn, span_start, span_end, exc_info=True)
+                finally:
+                    # Days upstream answered without prices back off too: past ones for EMPTY_TTL,
+                    # today and tomorrow (not published yet) like failures
+                    today = market_today()
+                    ttls = {d: self.empty_ttl if answered and d < today else self.failure_ttl
+                            for d in _date_range(span_start, span_end) if d not in written}
+                    for ttl in set(ttls.values()):
+                        for lo, hi in _spans([d for d in ttls if ttls[d] == ttl]): self._release(bzn, lo, hi, True, ttl)
+                    for lo, hi in _spans(sorted(written)): self._release(bzn, lo, hi, False)
+                for d in _date_range(span_start, span_end):
+                    if d in written: self._failed.pop((bzn, d), None)
+                    else: self._failed[(bzn, d)] = time.time() + ttls[d]
+            self._wait_remote(bzn, remote)
+        finally:
+            with self._lock:
+                for d in todo:
+                    self._inflight.pop((bzn, d)).set()
+
+        for event in waits:
+            event.wait(WAIT_TIMEOUT)
+        return calls
+
+    def backfill_zones(self, zones, start, end):
+        # backfill() of several zones at once, one thread per zone, so the wait is
+        # the slowest zone rather than the sum. Returns {bzn: upstream calls}.
+        zones = list(zones)
+        if len(zones) < 2: return {bzn: self.backfill(bzn, start, end) for bzn in zones}
+        with ThreadPoolExecutor(max_workers=len(zones), thread_name_prefix="omie-backfill") as pool:
+            return dict(zip(zones, pool.map(lambda bzn: self.backfill(bzn, start, end), zones)))
+
+    def _claim(self, bzn, days):
+        # Leases the days no other process is fetching; returns (claimed, days to wait for).
+        if not days: return [], []
+        now = time.time()
+        start, end = days[0].isoformat(), days[-1].isoformat()
+        claimed, remote = [], []
+        with self._connect() as conn:
+            conn.execute("BEGIN IMMEDIATE")
+            conn.execute("DELETE FROM fetches WHERE expires_at <= ?", (now,))
+            leases = dict(conn.execute(
+                "SELECT day, failed FROM fetches WHERE bzn = ? AND day BETWEEN ? AND ?", (bzn, start, end),
+            ).fetchall())
+            # Re-checked under the write lock: another process may have just stored some of these
+            due = dict(self._due_days(bzn, days[0], days[-1], conn))
+            for d in days:
+                if d not in due: continue
+                failed = leases.get(d.isoformat())
+                if failed is None: claimed.append(d)
+                elif not failed and not due[d]: remote.append(d)
+            conn.executemany(
+                "INSERT INTO fetches (bzn, day, owner, expires_at, failed) VALUES (?, ?, ?, ?, 0)",
+                [(bzn, d.isoformat(), self._owner, now + LEASE_TTL) for d in claimed],
+            )
+        return claimed, remote
+
+    def _release(self, bzn, start, end, failed, ttl=None):
+        # A failed lease stays behind for ttl (default failure_ttl) so other processes back off too.
+        args = (bzn, self._owner, start.isoformat(), end.isoformat())
+        with self._connect() as conn:
+            if failed:
+                conn.execute("UPDATE fetches SET expires_at = ?, failed = 1 WHERE bzn = ? AND owner = ? AND day BETWEEN ? AND ?",
+                             (time.time() + (ttl or self.failure_ttl),) + args)
+            else:
+                conn.execute("DELETE FROM fetches WHERE bzn = ? AND owner = ? AND day BETWEEN ? AND ?", args)
+
+    def _wait_remote(self, bzn, days):
+        # Polls until other processes release their leases on days (stored or failed) or WAIT_TIMEOUT.
+        pending = {d.isoformat() for d in days}
+        deadline = time.time() + WAIT_TIMEOUT
+        while pending and time.time() < deadline:
+            time.sleep(POLL_INTERVAL)
+            with self._connect() as conn:
+                rows = conn.execute(
+                    "SELECT day FROM fetches WHERE bzn = ? AND day BETWEEN ? AND ? AND failed = 0 AND expires_at > ?",
+                    (bzn, min(pending), max(pending), time.time()),
+                ).fetchall()
+            pending &= {day for (day,) in rows}
+
+    def _write(self, bzn, start, end, unix_seconds, prices):
+        # Stores a fetched span; returns the days of [start, end] that got prices
+        import pandas as pd  # fetch path only; reads stay pandas-free for the CLI
+
+        if not unix_seconds: return set()
+        points = pd.DataFrame({'ts': unix_seconds, 'price': prices}).dropna(subset=['ts'])
+        points['ts'] = points['ts'].astype('int64')
+        points['day'] = pd.to_datetime(points['ts'], unit='s', utc=True).dt.tz_convert(MARKET_TZ).dt.date
+        today = market_today()
+        now = time.time()
+        day_rows = []
+        for d, group in points.groupby('day'):
+            if not start <= d <= end: continue
+            # A day is complete once its last hour is present; past days never change.
+            _, day_end = day_bounds(d, d)
+            final = d < today or group['ts'].max() >= day_end - 3600
+            day_rows.append((bzn, d.isoformat(), now, int(final)))
+        price_rows = [
+            (bzn, int(ts), None if pd.isna(p) else float(p))
+            for ts, p in zip(points['ts'], points['price'])
+        ]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO prices (bzn, ts, price) VALUES (?, ?, ?)", price_rows)
+            conn.executemany("INSERT OR REPLACE INTO days (bzn, day, fetched_at, final) VALUES (?, ?, ?, ?)", day_rows)
+        self._update_rollups(bzn, start, end)
+        return {datetime.strptime(day, "%Y-%m-%d").date() for _, day, _, _ in day_rows}
+
+    def _update_rollups(self, bzn, start, end):
+        """Recomputes the daily ('D') and monthly ('M') rollups touched by market days [start, end].
+
+        Rollups are per local day/month of the zone over hourly means: mean,
+        min, max, p10/p50/p90 of the raw price, plus the hours in each tariff
+        period so a final-price average can be derived without the raw points.
+        """
+        import pandas as pd
+
+        # A zone's local day can straddle two market days
+        first, last = _month_start(start - timedelta(days=1)), _month_end(end)
+        hours, means = hourly_means(*self.load_arrays(bzn, first - timedelta(days=1), last + timedelta(days=1)))
+        keep = ~np.isnan(means)
+        if not keep.any(): return
+        local = pd.to_datetime(hours[keep], unit='s', utc=True).tz_convert(ZONE_TZ[bzn])
+        frame = pd.DataFrame({
+            'D': local.strftime('%Y-%m-%d'), 'M': local.strftime('%Y-%m'), 'price': means[keep],
+            'period': period_index(local.hour, local.dayofweek >= 5),
+        })
+        rows = []
+        bounds = {'D': ((start - timedelta(days=1)).isoformat(), end.isoformat()),
+                  'M': (first.isoformat()[:7], last.isoformat()[:7])}
+        for grain, (lo, hi) in bounds.items():
+            part = frame[(frame[grain] >= lo) & (frame[grain] <= hi)]
+            if part.empty: continue
+            price = part.groupby(grain)['price']
+            stats = pd.DataFrame({
+                'mean': price.mean(), 'min': price.min(), 'max': price.max(), 'p10': price.quantile(0.1),
+                'p50': price.quantile(0.5), 'p90': price.quantile(0.9), 'hours': price.size(),
+            }).join(pd.crosstab(part[grain], part['period']).reindex(columns=range(3), fill_value=0))
+            rows += [(bzn, grain, key, *map(float, r[:6]), *map(int, r[6:])) for key, *r in stats.itertuples()]
+        with self._connect() as conn:
+            conn.executemany("INSERT OR REPLACE INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)", rows)
+
+    def load_rollups(self, bzn, grain, start, end):
+        """Daily ('D') or monthly ('M') rollups of local days [start, end] as a frame.
+
+        Stored days without a rollup (stores from before rollups existed) are
+        rolled up first.
+        """
+        import pandas as pd
+
+        with self._connect() as conn:
+            missing = [datetime.strptime(day, "%Y-%m-%d").date() for (day,) in conn.execute(
+                "SELECT day FROM days WHERE bzn = ? AND day BETWEEN ? AND ? AND day NOT IN "
+                "(SELECT key FROM rollups WHERE bzn = ? AND grain = 'D')",
+                (bzn, start.isoformat(), end.isoformat(), bzn),
+            )]
+        for span_start, span_end in _spans(missing):
+            self._update_rollups(bzn, span_start, span_end)
+        lo, hi = (start.isoformat(), end.isoformat()) if grain == 'D' else (start.isoformat()[:7], end.isoformat()[:7])
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT key, mean, min, max, p10, p50, p90, hours, p1_hours, p2_hours, p3_hours FROM rollups "
+                "WHERE bzn = ? AND grain = ? AND key BETWEEN ? AND ? ORDER BY key",
+                (bzn, grain, lo, hi),
+            ).fetchall()
+        columns = ['Date', 'Raw_Price_MWh', 'Min', 'Max', 'P10', 'P50', 'P90', 'Hours', 'P1_Hours', 'P2_Hours', 'P3_Hours']
+        out = pd.DataFrame(rows, columns=columns)
+        out['Date'] = pd.to_datetime(out['Date'], format='%Y-%m-%d' if grain == 'D' else '%Y-%m').dt.date
+        return out
+
+    def load_arrays(self, bzn, start, end):
+        # (unix seconds, €/MWh) arrays for market days [start, end].
+        lo, hi = day_bounds(start, end)
+        with self._connect() as conn:
+            rows = conn.execute(
+                "SELECT ts, price FROM prices WHERE bzn = ? AND ts >= ? AND ts < ? ORDER BY ts",
+                (bzn, lo, hi),
+            ).fetchall()
+        ts = np.array([r[0] for r in rows], dtype=np.int64)
+        prices = np.array([np.nan if r[1] is None else r[1] for r in rows], dtype=np.float64)
+        return ts, prices
+
+    def load_series(self, bzn, start, end):
+        # Stored points for market days [start, end] as a compact PriceSeries (None if none stored).
+        return price_series(*self.load_arrays(bzn, start, end))
+
+    def load(self, bzn, start, end):
+        # Stored points for market days [start, end] as a UTC-indexed frame.
+        import pandas as pd
+
+        ts, prices = self.load_arrays(bzn, start, end)
+        return pd.DataFrame({'Timestamp': pd.to_datetime(ts, unit='s', utc=True), 'Raw_Price_MWh': prices})
+
+    def get_range(self, bzn, start, end):
+        self.backfill(bzn, start, end)
+        return self.load(bzn, start, end)
@@ -0,0 +1,80 @@
+from dataclasses import dataclass
+
+import numpy as np
+
+PERIOD_KEYS = ("P1", "P2", "P3")
+
+
+def get_period_key(hour, is_weekend):
+    if is_weekend: return "P3"
+    if 0 <= hour < 8: return "P3"
+    elif (8 <= hour < 10) or (14 <= hour < 18) or (22 <= hour < 24): return "P2"
+    else: return "P1"
+
+
+# Period index (0=P1, 1=P2, 2=P3) for [is_weekend, hour]
+PERIOD_MAP = np.array(
+    [[PERIOD_KEYS.index(get_period_key(h, w)) for h in range(24)] for w in (False, True)],
+    dtype=np.intp,
+)
+
+
+def period_index(hours, is_weekend):
+    # Vectorized get_period_key; both arguments broadcast against each other.
+    return PERIOD_MAP[np.asarray(is_weekend, dtype=np.intp), np.asarray(hours, dtype=np.intp)]
+
+
+@dataclass(frozen=True)
+class TariffConfig:
+    # Rates are fractions (0.23 for 23% VAT), fees are €/kWh.
+    vat: float = 0.23
+    comm_fee: float = 0.025
+    losses: float = 0.1674
+    grid_p1: float = 0.060
+    grid_p2: float = 0.060
+    grid_p3: float = 0.060
+
+    @property
+    def grid_fees(self):
+        return np.array([self.grid_p1, self.grid_p2, self.grid_p3])
+
+
+def _params(configs, ndim):
+    # (N, 6) parameter table reshaped to broadcast against an ndim price array.
+    table = np.array(
+        [(c.vat, c.comm_fee, c.losses, c.grid_p1, c.grid_p2, c.grid_p3) for c in configs],
+        dtype=np.float64,
+    ).reshape(-1, 6)
+    shape = (len(table),) + (1,) * ndim
+    vat, comm, losses = (table[:, i].reshape(shape) for i in range(3))
+    return vat, comm, losses, table[:, 3:]
+
+
+def final_prices_batch(raw_mwh, periods, configs):
+    """Final €/kWh prices for N tariff configs at once.
+
+    raw_mwh and periods share a shape S (e.g. hours, or days x hours); the
+    result has shape (N,) + S.
+    """
+    raw_mwh = np.asarray(raw_mwh, dtype=np.float64)
+    periods = np.broadcast_to(np.asarray(periods, dtype=np.intp), raw_mwh.shape)
+    vat, comm, losses, grid = _params(configs, raw_mwh.ndim)
+    grid_applied = np.take(grid, periods, axis=1)
+    # Core Formula
+    return ((raw_mwh / 1000) * (1 + losses) + comm + grid_applied) * (1 + vat)
+
+
+def final_prices(raw_mwh, periods, config):
+    return final_prices_batch(raw_mwh, periods, [config])[0]
+
+
+def average_final_prices(mean_raw_mwh, period_hours, config):
+    """Mean final €/kWh of days or months from rollups.
+
+    period_hours is (N, 3) hours spent in P1..P3. The tariff is affine in the
+    raw price within a period, so this equals averaging the hourly final prices.
+    """
+    mean_raw_mwh = np.asarray(mean_raw_mwh, dtype=np.float64)
+    period_hours = np.asarray(period_hours, dtype=np.float64).reshape(-1, 3)
+    grid = period_hours @ config.grid_fees / period_hours.sum(axis=1)
+    return ((mean_raw_mwh / 1000) * (1 + config.losses) + config.comm_fee + grid) * (1 + config.vat)